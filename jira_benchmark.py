@@ -0,0 +1,553 @@
+#!/usr/bin/env python
+"""
+Offline benchmark for jira_report(1.3-WIP).py.
+
+Serves fake issues from a local stub of the Jira REST API and times the main
+stages of a report run without using real Jira. Also imported by the tests
+(make_fake_issues(), StubJiraServer).
+
+Run using:
+    python jira_benchmark.py [sizes]
+e.g.
+    python jira_benchmark.py 1000 10000
+
+Micro-benchmarks of single stages run by name, with optional size:
+    python jira_benchmark.py table_rows [rows]    (cell_set() v table_rows())
+    python jira_benchmark.py write_only [rows]    (normal v write-only spreadsheet)
+    python jira_benchmark.py extract [issues]     (multi_getattr() v compiled accessors)
+"""
+
+#Report script has brackets in its name so is loaded from its path
+import imp
+import os
+#Used by stub Jira server
+import json
+import time
+import operator
+import re
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+#Used to generate fake issues
+import random
+#Used for benchmark output folder
+import shutil
+import tempfile
+import sys
+#Used to find peak memory of each spreadsheet type
+import multiprocessing
+
+jira_report = imp.load_source("jira_report", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "jira_report(1.3-WIP).py"))
+
+
+def make_fake_issues(count, project="K008", seed=1):
+    """
+    Generates raw details of fake Jira issues (as returned by Jira REST API),
+    with the same fields and shapes as the K008 field mapping: sprint strings,
+    lists of components, comment lists etc. Many values (statuses, sprints,
+    people...) repeat across issues as they would in a real project.
+    Args:
+        count - number of issues
+        project - project code used in issue keys
+        seed - random number seed (same seed gives same issues)
+    Returns:
+        list of dictionaries of raw issue details, newest first (like Jira)
+    """
+    rand = random.Random(seed)
+    statuses = ["New Bug", "Investigate/Fix", "In Test", "Failed", "Closed", "Resolved"]
+    priorities = ["P1 V. High", "P2 High", "P3 Medium", "P4 Low", "P5 V. Low"]
+    components = ["Portal", "Billing", "Reports", "Interfaces", "Security", "Data Migration"]
+    people = ["Ann Smith", "Bob Jones", "Cat Brown", "Dan White", "Eve Black", "Fay Green"]
+    words = ("the a report fails when user opens screen after saving record value "
+             "incorrect shown error message expected result actual date total").split()
+
+    def text(length):
+        return " ".join([rand.choice(words) for i in range(length)]).capitalize() + "."
+
+    def date(day):
+        return "2016-%02d-%02dT%02d:%02d:%02d.000+0000" % (1+day/28%12, 1+day%28, rand.randint(8,17),
+                                                            rand.randint(0,59), rand.randint(0,59))
+
+    issues = []
+    for number in range(count, 0, -1):
+        sprint = 1 + number * 20 / max(count, 1)
+        created = rand.randint(0, 300)
+        comments = []
+        for c in range(rand.randint(0, 5)):
+            comments.append({"author":{"displayName":rand.choice(people)}, "body":text(rand.randint(5,40)),
+                             "updated":date(created+c+1)})
+        status = rand.choice(statuses)
+        issues.append({"key":"%s-%i" % (project, number), "id":str(10000+number), "fields":{
+            "issuetype":{"name":rand.choice(["Bug", "Bug", "Bug", "Task", "Story"])},
+            "summary":text(rand.randint(4,12)),
+            "customfield_10003":["com.atlassian.greenhopper.service.sprint.Sprint@1af0af6[id=%i,rapidViewId=1,"
+                                 "state=CLOSED,name=%s - Sprint %i,startDate=2016-02-26T11:59:42.924Z,"
+                                 "endDate=2016-03-25T11:59:00.000Z,completeDate=<null>,sequence=%i]" % (sprint, project, sprint, sprint)],
+            "customfield_11100":{"value":rand.choice(["Defect", "Change", "Query"])},
+            "components":[{"name":name} for name in rand.sample(components, rand.randint(0,2))],
+            "priority":{"name":rand.choice(priorities)},
+            "status":{"name":status},
+            "assignee":{"displayName":rand.choice(people)} if rand.random() > 0.1 else None,
+            "reporter":{"displayName":rand.choice(people)},
+            "created":date(created),
+            "updated":date(created+rand.randint(0,60)),
+            "resolution":{"name":"Fixed"} if status in ("Closed", "Resolved") else None,
+            "description":"\n".join([text(rand.randint(10,60)) for i in range(rand.randint(1,4))]),
+            "customfield_10101":{"value":rand.choice(["SIT", "UAT", "Live"])},
+            "customfield_10405":{"value":rand.choice(["Critical", "Major", "Minor"])},
+            "comment":{"comments":comments, "maxResults":len(comments), "total":len(comments), "startAt":0},
+            }})
+    return issues
+
+
+class StubJiraHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handles requests made to StubJiraServer"""
+    def log_message(self, *args):
+        #Don't log each request
+        pass
+
+    def send_json(self, value, status=200):
+        body = json.dumps(value)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            #Stub Jira doesn't keep clients waiting
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        #Repeated parameters (e.g. fields=a&fields=b) joined by commas
+        params = dict((k, ",".join(v)) for k, v in urlparse.parse_qs(url.query).items())
+        self.respond(url.path, params)
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        length = int(self.headers.getheader("Content-Length") or 0)
+        params = json.loads(self.rfile.read(length) or "{}")
+        self.respond(url.path, params)
+
+    def respond(self, path, params):
+        stub = self.server.stub
+        stub.count_request(path)
+        if stub.latency:
+            time.sleep(stub.latency)
+        api = "/rest/api/2/"
+        if path == api+"serverInfo":
+            self.send_json({"versionNumbers":[7,0,0], "version":"7.0.0", "deploymentType":"Server"})
+        elif path == api+"field":
+            self.send_json([])
+        elif path == api+"project":
+            self.send_json([{"key":key, "name":name} for key, name in sorted(stub.projects.items())])
+        elif path.startswith(api+"project/"):
+            key = path.split("/")[-1]
+            if key in stub.projects:
+                self.send_json({"key":key, "name":stub.projects[key]})
+            else:
+                self.send_json({"errorMessages":["No project could be found with key '%s'." % key]}, 404)
+        elif path.startswith(api+"issue/"):
+            key = path.split("/")[-1]
+            if key in stub.by_key:
+                self.send_json(stub.trim(stub.by_key[key], params.get("fields")))
+            else:
+                self.send_json({"errorMessages":["Issue Does Not Exist"]}, 404)
+        elif path == api+"search":
+            error = stub.search_error()
+            if error:
+                self.send_json({"errorMessages":["Search failed (stub)"]}, error)
+                return
+            try:
+                self.send_json(stub.search(params))
+            except ValueError as e:
+                self.send_json({"errorMessages":[str(e)]}, 400)
+        else:
+            self.send_json({"errorMessages":["Not supported by stub: "+path]}, 404)
+
+
+class StubHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+#Names JQL accepts for the issue key field
+KEY_ALIASES = ("key", "issuekey", "issue", "id")
+
+
+class StubJiraServer:
+    """
+    Local web server providing enough of the Jira REST API (server info,
+    projects, issues and searches) for JiraComm to be used without real Jira.
+    Runs in background thread. Used by run_benchmark() and the tests.
+    Searches support the JQL used by JiraComm: clauses such as "project=X",
+    "key in (...)", 'priority="P2 High"' or 'key > "K008-100"' (field compared
+    with value or in list of values) joined by AND, optionally followed by
+    ORDER BY one field. Other clauses are ignored. As in Jira, id is another
+    name for key, and keys are compared by issue number only within a project.
+
+    args:
+        issues - list of raw issue details (e.g. from make_fake_issues())
+        page_cap - maximum number of results returned by a search (like Jira's own limit)
+        latency - seconds added to each request
+
+    Searches can be made to fail by adding entries to self.search_errors,
+    each either None (search works) or a status code returned instead of
+    results, used one per search in order.
+    """
+    def __init__(self, issues, page_cap=1000, latency=0):
+        self.issues = issues
+        self.by_key = dict((issue["key"], issue) for issue in issues)
+        self.projects = dict((issue["key"].split("-")[0], issue["key"].split("-")[0]+" (stub)") for issue in issues)
+        self.page_cap = page_cap
+        self.latency = latency
+        #Number of requests received for each path
+        self.requests = {}
+        self.search_errors = []
+        self.lock = threading.Lock()
+
+        self.httpd = StubHTTPServer(("127.0.0.1", 0), StubJiraHandler)
+        self.httpd.stub = self
+        self.url = "http://127.0.0.1:%i" % self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def count_request(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def search_error(self):
+        """Returns status code for next search to fail with (None if it should work)"""
+        with self.lock:
+            return self.search_errors.pop(0) if self.search_errors else None
+
+    def stop(self):
+        """Stops the server"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def trim(self, issue, fields):
+        """Returns issue with only the chosen fields (comma separated string or list)"""
+        if not fields or fields in ("*all", ["*all"]):
+            return issue
+        if isinstance(fields, basestring):
+            fields = fields.split(",")
+        return {"key":issue["key"], "id":issue["id"],
+                "fields":dict((name, value) for name, value in issue["fields"].items() if name in fields)}
+
+    def jql_values(self, text):
+        """Returns list of values from JQL list, e.g. '("A", B)' gives ["A","B"]"""
+        return [value.strip().strip('"') for value in text.strip()[1:-1].split(",")]
+
+    def field_text(self, issue, name):
+        """Returns value of issue field as text used by JQL, e.g. status name.
+        Keys (and their JQL aliases, including id) given as (project, number)
+        tuples, so they sort like Jira sorts keys"""
+        if name == "project":
+            return issue["key"].split("-")[0]
+        if name in KEY_ALIASES:
+            return self.key_value(issue["key"])
+        value = issue["fields"].get(name)
+        if isinstance(value, dict):
+            return value.get("name", value.get("value"))
+        return value
+
+    def key_value(self, text):
+        """Returns (project, number) tuple for issue key in JQL, e.g. ("K008", 17)
+        for "K008-17". As in Jira, a number is taken to be an issue id and
+        replaced by the key of that issue"""
+        if text.isdigit():
+            for issue in self.issues:
+                if issue["id"] == text:
+                    text = issue["key"]
+                    break
+            else:
+                raise ValueError("An issue with key '%s' does not exist for field 'key'." % text)
+        project, number = text.rsplit("-", 1)
+        return (project, int(number))
+
+    def matches(self, jql, validate=True):
+        """Returns issues matching JQL search string. Like Jira, when validate
+        is True a search for keys of issues that don't exist fails (ValueError)"""
+        search, order = (jql.split(" ORDER BY ") + [""])[:2]
+        issues = self.issues
+        if order:
+            name = order.split()[0].lower()
+            issues = sorted(issues, key=lambda issue: self.field_text(issue, name),
+                            reverse=order.upper().endswith(" DESC"))
+
+        compare = {">=":operator.ge, "<=":operator.le, ">":operator.gt, "<":operator.lt}
+        for clause in search.split(" AND "):
+            match = re.match(r"(\w+)\s*(>=|<=|=|>|<|in\b)\s*(.*)$", clause.strip(), re.IGNORECASE)
+            if not match:
+                continue
+            name, op, text = match.group(1).lower(), match.group(2).lower(), match.group(3)
+            if op == "in":
+                values = self.jql_values(text)
+                if name in KEY_ALIASES:
+                    if validate:
+                        for key in sorted(set(values) - set(self.by_key)):
+                            raise ValueError("An issue with key '%s' does not exist for field 'key'." % key)
+                    values = [self.key_value(key) for key in values if key in self.by_key]
+                values = set(values)
+                issues = [issue for issue in issues if self.field_text(issue, name) in values]
+            elif op == "=":
+                value = text.strip().strip('"')
+                if name in KEY_ALIASES:
+                    value = self.key_value(value)
+                issues = [issue for issue in issues if self.field_text(issue, name) == value]
+            elif name in KEY_ALIASES:
+                #Jira only compares keys of the same project (by issue number)
+                project, number = self.key_value(text.strip().strip('"'))
+                issues = [issue for issue in issues if self.field_text(issue, name)[0] == project
+                          and compare[op](self.field_text(issue, name)[1], number)]
+            else:
+                value = text.strip().strip('"')
+                if value.isdigit():
+                    value = int(value)
+                issues = [issue for issue in issues if self.field_text(issue, name) is not None
+                          and compare[op](self.field_text(issue, name), value)]
+        return issues
+
+    def search(self, params):
+        """Returns search results for search request parameters"""
+        validate = str(params.get("validateQuery", True)).lower() != "false"
+        issues = self.matches(params.get("jql", ""), validate)
+        start_at = int(params.get("startAt") or 0)
+        max_results = min(int(params.get("maxResults", 50)), self.page_cap)
+        fields = params.get("fields")
+        page = [self.trim(issue, fields) for issue in issues[start_at:start_at+max_results]]
+        return {"startAt":start_at, "maxResults":max_results, "total":len(issues), "issues":page}
+
+
+#Reprocess mapping used by the report script
+REPROCESS_MAPPING = {"Sprint":"sprint names", "Components":"name concat", "Date Created":"datetime",
+                     "Date Updated":"datetime", "Latest Comment":"latest comment"}
+
+#Reprocess mapping used before column transforms were added (row by row functions only)
+ROW_REPROCESS_MAPPING = {"Sprint":"sprint name", "Components":"name concat", "Date Created":"date fix",
+                         "Date Updated":"date fix", "Latest Comment":"latest comment"}
+
+
+def run_benchmark(sizes=(1000, 10000, 100000), raw=False, write_only=False):
+    """
+    Times main stages of a report run (retrieving issues, extracting
+    details, writing report, saving spreadsheet) for different numbers of
+    fake issues, using StubJiraServer rather than real Jira.
+    Args:
+        sizes - list of numbers of issues to time
+        raw (bool) - retrieve raw issue details (see JiraComm.get_project_issues())
+        write_only (bool) - use write-only spreadsheet (see ExcelSheet)
+    Returns:
+        list of dictionaries of timings (seconds), one per size
+    """
+    reprocess_mapping = REPROCESS_MAPPING
+    folder = tempfile.mkdtemp()
+    results = []
+    print "%10s %10s %10s %10s %10s" % ("Issues", "Retrieve", "Extract", "Report", "Save")
+    try:
+        for size in sizes:
+            server = StubJiraServer(make_fake_issues(size))
+            try:
+                go = jira_report.JiraComm("bench", "bench", folder=folder, reprocess_mapping=reprocess_mapping,
+                              excel_file_start="Benchmark_%i" % size, server=server.url, write_only=write_only)
+                timing = {"issues":size}
+
+                started = time.time()
+                issues = go.retrieve_project_issues("K008", raw=raw)
+                timing["retrieve"] = time.time()-started
+
+                started = time.time()
+                if raw:
+                    go.extracted_results = go.extract_raws(issues)
+                else:
+                    go.issues = issues
+                    go.extract_info()
+                timing["extract"] = time.time()-started
+
+                started = time.time()
+                go.report(tab="All Bugs")
+                timing["report"] = time.time()-started
+
+                started = time.time()
+                go.excel.save()
+                timing["save"] = time.time()-started
+            finally:
+                server.stop()
+            results.append(timing)
+            print "%10i %10.2f %10.2f %10.2f %10.2f" % (size, timing["retrieve"], timing["extract"],
+                                                         timing["report"], timing["save"])
+    finally:
+        shutil.rmtree(folder)
+    return results
+
+
+def offline_comm(folder, **kwargs):
+    """Returns JiraComm for use without Jira (stub server only used while
+    connecting) and the report headings. Keyword arguments passed to JiraComm"""
+    server = StubJiraServer([])
+    try:
+        go = jira_report.JiraComm("bench", "bench", folder=folder, server=server.url, **kwargs)
+    finally:
+        server.stop()
+    return go, [item[0] for item in go.field_mapping]
+
+
+def report_rows(count):
+    """Returns report headings and rows of values for count fake issues"""
+    folder = tempfile.mkdtemp()
+    try:
+        go, headings = offline_comm(folder, reprocess_mapping=REPROCESS_MAPPING)
+        return headings, [go.result_row(result, headings) for result in go.extract_raws(make_fake_issues(count))]
+    finally:
+        shutil.rmtree(folder)
+
+
+def benchmark_table_rows(count=20000):
+    """
+    Compares writing report rows one cell at a time (as JiraComm.report()
+    used to) with ExcelSheet.table_rows(). Cell by cell timed both as
+    originally written (new Font for each cell) and using the current
+    ExcelSheet.cell_set() (shared fonts). table_rows() should be at least
+    5 times quicker than the original.
+    Args:
+        count - number of rows written
+    Returns:
+        dictionary of timings (seconds) and speed-up over original
+    """
+    headings, rows = report_rows(count)
+    timing = {"rows":count}
+
+    #Original ExcelSheet.cell_set()
+    excel = jira_report.ExcelSheet(tabrename="Rows")
+    started = time.time()
+    for ri, row in enumerate(rows):
+        for ci, value in enumerate(row):
+            ws = excel.select_ws("Rows")
+            cell = ws.cell(row=2+ri, column=1+ci)
+            cell.value = value
+            cell.font = jira_report.openpyxl.styles.Font(color="FF000000")
+            cell.border = excel.cell_thin_border
+    timing["original"] = time.time()-started
+
+    excel = jira_report.ExcelSheet(tabrename="Rows")
+    started = time.time()
+    for ri, row in enumerate(rows):
+        for ci, value in enumerate(row):
+            excel.cell_set("Rows", 2+ri, 1+ci, value, border=True)
+    timing["cell_set"] = time.time()-started
+
+    excel = jira_report.ExcelSheet(tabrename="Rows")
+    started = time.time()
+    excel.table_rows("Rows", 2, 1, rows, border=True)
+    timing["table_rows"] = time.time()-started
+
+    timing["speed_up"] = timing["original"] / timing["table_rows"]
+    print "%10s %10s %10s %10s %10s" % ("Rows", "Original", "cell_set", "table_rows", "Speed-up")
+    print "%10i %10.2f %10.2f %10.2f %9.1fx" % (count, timing["original"], timing["cell_set"],
+                                                timing["table_rows"], timing["speed_up"])
+    return timing
+
+
+def save_rows(rows, headings, write_only, results):
+    """Writes and saves report rows in a normal or write-only spreadsheet,
+    putting peak memory growth (MB) and times (seconds) in results queue.
+    Run in its own process so its peak memory can be found"""
+    #Linux gives peak memory in KB
+    baseline = jira_report.resource.getrusage(jira_report.resource.RUSAGE_SELF).ru_maxrss
+    folder = tempfile.mkdtemp()
+    try:
+        excel = jira_report.ExcelSheet(os.path.join(folder, "Rows.xlsx"), tabrename="Rows", write_only=write_only)
+        started = time.time()
+        excel.table_headings("Rows", 1, 1, headings)
+        excel.table_rows("Rows", 2, 1, rows, border=True)
+        written = time.time()
+        excel.save()
+        saved = time.time()
+        peak = jira_report.resource.getrusage(jira_report.resource.RUSAGE_SELF).ru_maxrss
+        results.put({"write":written-started, "save":saved-written, "peak_mb":(peak-baseline)/1024.0})
+    finally:
+        shutil.rmtree(folder)
+
+
+def benchmark_write_only(count=100000):
+    """
+    Compares peak memory growth and save time of a normal spreadsheet
+    with those of a write-only one (see ExcelSheet) for a report of count
+    rows. Each spreadsheet built in its own process. Needs resource module
+    (not available on Windows).
+    Args:
+        count - number of rows written
+    Returns:
+        dictionary of results for "normal" and "write-only" spreadsheets
+    """
+    headings, rows = report_rows(count)
+    timings = {}
+    print "%10s %12s %10s %10s %10s" % ("Rows", "Spreadsheet", "Write", "Save", "Peak MB")
+    for name, write_only in (("normal", False), ("write-only", True)):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=save_rows, args=(rows, headings, write_only, results))
+        process.start()
+        timings[name] = results.get()
+        process.join()
+        print "%10i %12s %10.2f %10.2f %10.1f" % (count, name, timings[name]["write"], timings[name]["save"],
+                                                  timings[name]["peak_mb"])
+    return timings
+
+
+def benchmark_extract(count=5000):
+    """
+    Compares extracting details of issues using multi_getattr() for each
+    field (as JiraComm.issue_details() used to) with the compiled field
+    accessors of JiraComm.extract_details(), for Jira issue objects and raw
+    issue details. The same row by row reprocess functions used by both.
+    Args:
+        count - number of issues
+    Returns:
+        dictionary of timings (seconds)
+    """
+    folder = tempfile.mkdtemp()
+    try:
+        go, headings = offline_comm(folder, reprocess_mapping=ROW_REPROCESS_MAPPING)
+    finally:
+        shutil.rmtree(folder)
+    raws = make_fake_issues(count)
+    issues = [go.issue_from_raw(raw) for raw in raws]
+    timing = {"issues":count}
+
+    started = time.time()
+    for issue in issues:
+        details = {}
+        for item in go.field_mapping:
+            value = jira_report.multi_getattr(issue, item[2])
+            if item[0] in go.reprocess_mapping and value:
+                value = go.reprocess[go.reprocess_mapping[item[0]]](value)
+            details[item[0]] = value
+    timing["multi_getattr"] = time.time()-started
+
+    started = time.time()
+    go.extract_details(issues)
+    timing["compiled"] = time.time()-started
+
+    started = time.time()
+    go.extract_details(raws, raw=True)
+    timing["compiled_raw"] = time.time()-started
+
+    print "%10s %14s %10s %13s" % ("Issues", "multi_getattr", "Compiled", "Compiled raw")
+    print "%10i %14.2f %10.2f %13.2f" % (count, timing["multi_getattr"], timing["compiled"], timing["compiled_raw"])
+    return timing
+
+
+#Micro-benchmarks which can be run by name instead of run_benchmark()
+BENCHMARKS = {"table_rows":benchmark_table_rows, "write_only":benchmark_write_only, "extract":benchmark_extract}
+
+
+if __name__=="__main__":
+    #e.g. "table_rows 20000" runs benchmark_table_rows(20000)
+    if sys.argv[1:] and sys.argv[1] in BENCHMARKS:
+        BENCHMARKS[sys.argv[1]](*[int(arg) for arg in sys.argv[2:]])
+    else:
+        sizes = [int(arg) for arg in sys.argv[1:]]
+        run_benchmark(sizes or (1000, 10000, 100000))
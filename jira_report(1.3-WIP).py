@@ -3,16 +3,58 @@
 #Used to access Jira
 from jira import JIRA
 from jira.exceptions import JIRAError
+#Used to rebuild Jira issue objects from saved snapshots
+from jira.resources import Issue
 #Used to create and updatedExcel spreadsheets
 import openpyxl
+from openpyxl.formatting.rule import FormulaRule
 #For password input
 import getpass
 #Generally usefull
 import time
+#Used to copy cell styles
+import copy
+#Used to chain generators when streaming results
+import itertools
 #Used with getattr to read nested attributes from values in string
 import functools
+#Used to create attribute getters for field mapping
+import operator
 #Used to create sub-folder
 import os
+#Used to save/load project snapshots
+import json
+#Used for on-disk issue cache
+import sqlite3
+import threading
+#Used for timing stages of run
+import contextlib
+#Used to find peak memory use (not available on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+#Used to check platform and read command line options
+import sys
+#Used for connection pool
+from requests.adapters import HTTPAdapter
+#Used to write reports to CSV files
+import csv
+#Used to write reports to Parquet files (optional)
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+#Used to retrieve pages of search results in parallel
+from multiprocessing.pool import ThreadPool
+#Used to extract details in parallel
+import multiprocessing
+#Used by column transforms
+import datetime
+import re
+#Used to silence Jira's warning about searches with maxResults=0 (see JiraComm.count_issues())
+import warnings
 
 """
 Extracts details fro Jira
@@ -119,6 +161,152 @@ in multiple batches. This means no longer limited by 1000 issue limit.
         Not changed - self.field_mapping and reprocess_mapping
 
         Added ExcelSheet class (copied from hub checking script)
+
+    (2) JiraComm.get_project_issues() now has workers argument. When greater
+        than 1 the first page is retrieved to find the total, then the remaining
+        pages are retrieved in parallel (JiraComm.search_pages_parallel())
+
+    (3) JiraComm.get_project_issues() now has incremental argument. When True
+        only issues updated since the previous run are retrieved and merged
+        into a locally saved snapshot of the project (see JiraComm.load_snapshot()
+        and JiraComm.save_snapshot()). Snapshots held in self.snapshot_folder
+
+    (4) Added IssueCache class. On-disk (SQLite) cache of raw issue details.
+        Used by JiraComm when cache_file argument set. JiraComm.get_issue(),
+        JiraComm.issue_comments() and JiraComm.get_project_issues() use cached
+        details when not older than cache_ttl seconds.
+
+    (5) ExcelSheet now has optional write_only mode using openpyxl's streaming
+        write-only workbook. Cells are held until their row is written by
+        ExcelSheet.flush() (rows from ExcelSheet.table_rows() are appended
+        straight away instead). Font objects now shared (ExcelSheet.get_font()).
+
+    (6) Added ExcelSheet.table_rows(). Writes rows of values with styling,
+        copying a cached style to each cell (ExcelSheet.get_style()).
+        JiraComm.report() now uses it instead of ExcelSheet.cell_set() for each cell.
+
+    (7) self.field_mapping now compiled into accessor functions (one per column,
+        with any reprocess function included) by JiraComm.compile_field_mapping().
+        Used by JiraComm.issue_details() instead of multi_getattr().
+        Missing attributes now give None rather than the last attribute found.
+
+    (8) JiraComm.get_project_issues() now has raw argument. When True search
+        results retrieved as raw JSON details rather than Jira issue objects
+        and details extracted directly from them (JiraComm.raw_issue_details()).
+        Only self.extracted_results kept (self.issues left empty).
+        Standard reprocess functions work with both (see field_value()).
+
+    (9) Added JiraComm.stream_report(). Retrieves project's issues a page at
+        a time (JiraComm.iter_pages()), extracts details and writes them to
+        spreadsheet as each page arrives. Only keeps results when asked to.
+        Best used with write-only spreadsheet.
+
+    (10) Added ResultStore class. Holds results column-wise with indexes
+        (built when first needed) for selecting, grouping and counting.
+        JiraComm.results_store() gives one holding self.extracted_results.
+        __main__ uses it for open bugs, bugs by item and priority counts.
+
+    (11) Added JiraComm.bulk_issue_comments(). Gets comments of several issues,
+        retrieving any missing in a few "key in (...)" searches run in parallel
+        rather than one request per issue.
+
+    (12) Added AsyncJiraComm class (JiraComm with non-blocking methods).
+        Requests run on a shared pool of threads and return AsyncResult objects
+        (from multiprocessing.pool) whose get() method waits for the result.
+        (asyncio not available in Python 2.7.)
+
+    (13) Retrieval of search results more robust. JiraComm.search_page() now
+        retries when Jira busy (429) or failing (500), waiting as asked by
+        Retry-After (502, 503 and 504 are retried by the jira module itself).
+        JiraComm.iter_pages() and JiraComm.search_pages_parallel() now use the
+        total to decide when finished, and use the server's page size when
+        smaller than max_results. Time taken by each page held in
+        self.page_timings. Incomplete results now reported and shown in the
+        report title (previously results could be silently truncated).
+
+    (14) JiraComm.get_project_issues() now has headings argument. When set
+        only the fields needed for those headings are retrieved, apart from
+        large fields (self.heavy_fields, e.g. description and comment).
+        These are retrieved by JiraComm.report(), in bulk, only for the
+        results it writes (JiraComm.fill_lazy()).
+
+    (15) Added RunStats class. Times and counts the main stages of a run
+        (Jira searches, extraction, report writing, saving), bytes received
+        and peak memory. Used by JiraComm (self.stats) when stats argument
+        True. JiraComm.write_run_stats() adds "Run Stats" tab after "Info",
+        JiraComm.save_run_stats() saves them as JSON.
+
+    (16) Jira server now set by JiraComm server argument (defaults to LAA Jira).
+        Added jira_benchmark.py (separate script, loads this one) holding
+        make_fake_issues() (generates realistic fake issue details),
+        StubJiraServer (local web server providing enough of the Jira REST API
+        for JiraComm, using fake issues) and run_benchmark(). Benchmark times
+        retrieval, extraction, report writing and saving for 1k, 10k and 100k
+        issues without using real Jira. Run using:
+            python jira_benchmark.py [sizes]
+
+    (17) Faster startup. All projects no longer listed when JiraComm created
+        and server info not requested. Instead each project is looked up
+        in Jira when first used (see JiraComm.project_name()) and remembered
+        for project_ttl seconds. self.projects only holds projects looked up so far
+        (JiraComm.load_projects() gets the lot). Jira connections now come from
+        a connection pool (see shared_adapter()), with size set by pool_size
+        argument, which is shared by all JiraComm objects so connections are kept
+        open and re-used. Pool used from the first request (see PooledJIRA).
+
+    (18) Extraction of details can now be split between several processes
+        (processes argument of JiraComm.extract_info(), extract_processes argument
+        of JiraComm.get_project_issues()), for very large numbers of issues.
+        Order of results unchanged. Standard reprocess functions now defined at
+        module level and custom ones should be added using register_reprocess_fn()
+        so they can be found by name in other processes.
+
+    (19) Added column transforms: reprocess functions which take a whole column
+        of values at once (see register_column_fn()). Standard ones are
+        "datetime" (Jira dates to real dates, so can be sorted in Excel) and
+        "sprint names" (names of all sprints, found using regular expression with
+        results remembered as many issues share same sprints). Dates written to
+        spreadsheet in ExcelSheet.date_format.
+
+    (20) Extracted results now held as ResultRow objects rather than dictionaries
+        (used in same way but much smaller). Repeated values (statuses, names etc.)
+        shared between results rather than each having own copy
+        (see JiraComm.intern_values()), saving memory and speeding up grouping.
+
+    (21) Reports can now be written by different exporters: ExcelSheet (default),
+        CsvExporter (CSV file for each tab) or ParquetExporter (Parquet file for
+        each tab, needs pyarrow). All have write_table() and save() methods.
+        Choose using JiraComm.exporter or exporter argument of JiraComm.report()
+        and JiraComm.stream_report(). CSV and Parquet rows written as produced
+        so memory use doesn't grow with number of issues.
+
+    (22) Added JiraComm.highlight() and ExcelSheet.highlight_rules(). Highlight
+        report cells using simple rules ("equals", "contains", "in", "older than")
+        which are added to spreadsheet as Excel conditional formatting (so
+        applied by Excel, no need to check each cell here). Counts of matching
+        results found from ResultStore indexes. Also work with write-only
+        spreadsheets. ExcelSheet.highlighter() still available for other conditions.
+
+    (23) Added JiraComm.count_issues() and JiraComm.priority_counts(), which get
+        numbers of matching issues from Jira without retrieving the issues
+        (searches with maxResults=0, run at the same time). Run script with
+        --counts to only fill in the Info tab priority counts this way.
+
+    (24) Added keyset paging (paging="keyset" argument of JiraComm.get_project_issues()
+        etc.). Issues retrieved in order of key, each page asking for issues
+        with key after the last one received rather than starting from a
+        position, so later pages no quicker than earlier ones and changes
+        made while retrieving can't cause missing or repeated issues. With
+        more than one worker project split into ranges of issue number
+        retrieved at the same time (JiraComm.search_ranges_parallel()).
+        One project at a time (JQL only compares keys within a project).
+
+    (25) JiraComm.get_project_issues() can now be given list of projects. Their
+        issues retrieved by one search ("project in (...)") then split by project,
+        with results and details of the run for each project held in
+        self.project_runs (use JiraComm.use_project() to select one).
+        JiraComm.build_reports() does the same when combined=True, which the
+        script now uses.
 """
 
 def multi_getattr(obj, attr, default = None):
@@ -145,6 +333,328 @@ def multi_getattr(obj, attr, default = None):
     return obj
 
 
+def field_accessor(attr, reprocess_fn=None):
+    """
+    Creates function which gets a named attribute from an object, e.g. for
+    attr 'a.b.c' function(x) returns x.a.b.c or None when any attribute in
+    the chain doesn't exist.
+    Args:
+        attr - attribute name, can be nested, e.g. "fields.status.name"
+        reprocess_fn - optional function applied to the attribute value
+            (when value found and not empty)
+    Returns:
+        the function
+    """
+    getter = operator.attrgetter(attr)
+    if reprocess_fn:
+        def accessor(obj):
+            try:
+                value = getter(obj)
+            except AttributeError:
+                return None
+            if value:
+                value = reprocess_fn(value)
+            return value
+    else:
+        def accessor(obj):
+            try:
+                return getter(obj)
+            except AttributeError:
+                return None
+    return accessor
+
+
+def raw_field_accessor(attr, reprocess_fn=None):
+    """
+    Creates function which gets a named item from raw Jira details (nested
+    dictionaries as returned by the Jira REST API), e.g. for attr 'a.b.c'
+    function(x) returns x["a"]["b"]["c"] or None when any item in the chain
+    doesn't exist. Same as field_accessor() but for raw details.
+    Args:
+        attr - item name, can be nested, e.g. "fields.status.name"
+        reprocess_fn - optional function applied to the item value
+            (when value found and not empty)
+    Returns:
+        the function
+    """
+    names = attr.split(".")
+    def accessor(obj):
+        for name in names:
+            try:
+                obj = obj[name]
+            except (KeyError, TypeError):
+                return None
+        if obj and reprocess_fn:
+            obj = reprocess_fn(obj)
+        return obj
+    return accessor
+
+
+def field_value(obj, name):
+    """
+    Gets named value from either Jira resource object (as attribute) or
+    raw Jira details (as dictionary item). Allows reprocess functions to
+    work with both.
+    """
+    if isinstance(obj, dict):
+        return obj[name]
+    return getattr(obj, name)
+
+
+#Reprocess functions available by name {name:function} (see register_reprocess_fn())
+REPROCESS_FNS = {}
+
+def register_reprocess_fn(name, fn):
+    """
+    Makes function available for reprocessing results by name to all JiraComm
+    objects (see JiraComm.define_reprocess_fns()). Needed for function to
+    be used when details extracted in several processes, so function should be
+    defined at module level (not lambda or nested function).
+    Args:
+        name - name used in reprocess_mapping, e.g. "date fix"
+        fn - function taking value retrieved from Jira and returning new value
+    Returns:
+        fn (so can be used as decorator)
+    """
+    REPROCESS_FNS[name] = fn
+    return fn
+
+
+def date_fix(jdate):
+    """Re-arranges Jira date to nicer format, e.g. '2016-03-11T15:32:28.000+0000'
+    to 11/03/2016 15:32:28
+    """
+    return jdate[8:10]+"/"+jdate[5:7]+"/"+jdate[:4]+" "+jdate[11:19]
+
+register_reprocess_fn("date fix", date_fix)
+
+
+def name_concat(field):
+    """Originally created to concatenate component names into comma-separated string"""
+    return ",".join([field_value(e, "name") for e in field])
+
+register_reprocess_fn("name concat", name_concat)
+
+
+def latest_comment(comments):
+    """Author, date and text of latest comment"""
+    #Sometimes comment lacks attributes such as author, so exception handling added to skip these
+    try:
+        #extract info from the latest comment
+        latest = comments[-1]
+        info = "["+field_value(field_value(latest, "author"), "displayName") + ", "+date_fix(field_value(latest, "updated")) + "] "+field_value(latest, "body")
+    except Exception as e:
+        info = ""
+    return info
+
+register_reprocess_fn("latest comment", latest_comment)
+
+
+def sprint_name(sprint_field):
+    """Sprint name
+    bit troublesome as issue.fields.customfield_10003 is a list containing a string, from which we only want a substring
+    [u'com.atlassian.greenhopper.service.sprint.Sprint@1af0af6[id=4,rapidViewId=1,state=ACTIVE,name=K008 - Sprint 1,startDate=2016-02-26T11:59:42.924Z,endDate=2016-03-25T11:59:00.000Z,completeDate=<null>,sequence=4]']
+    """
+    text = sprint_field[0]
+    start = 5 + text.find("name=")
+    end = text.find(",", start)
+    value = text[start:end]
+    return value
+
+register_reprocess_fn("sprint name", sprint_name)
+
+
+#Column transforms available by name {name:function} (see register_column_fn())
+COLUMN_FNS = {}
+
+def register_column_fn(name, fn):
+    """
+    Makes column transform available by name to all JiraComm objects. Like
+    reprocess functions (see register_reprocess_fn()) but transforms a whole
+    column of values at once rather than one value at a time, so can be
+    quicker, e.g. by re-using results for repeated values.
+    Args:
+        name - name used in reprocess_mapping, e.g. "datetime"
+        fn - function taking list of values retrieved from Jira and returning
+            list of new values (same length and order)
+    Returns:
+        fn (so can be used as decorator)
+    """
+    COLUMN_FNS[name] = fn
+    return fn
+
+
+def jira_datetimes(values):
+    """Converts Jira dates, e.g. '2016-03-11T15:32:28.000+0000', to datetimes
+    (Jira time, ignoring time zone, as date_fix()). Empty values unchanged.
+    """
+    #Many values share the same day, so each day only converted once
+    days = {}
+    results = []
+    for value in values:
+        if value:
+            day = value[:10]
+            if day not in days:
+                days[day] = datetime.datetime(int(day[:4]), int(day[5:7]), int(day[8:10]))
+            value = days[day] + datetime.timedelta(0, int(value[11:13])*3600 + int(value[14:16])*60 + int(value[17:19]))
+        results.append(value)
+    return results
+
+register_column_fn("datetime", jira_datetimes)
+
+
+#Finds sprint name in greenhopper sprint string (see sprint_name())
+SPRINT_NAME = re.compile(r"name=([^,\]]*)")
+#Sprint names already found {tuple of sprint strings:sprint names}
+SPRINT_MEMO = {}
+
+def sprint_names(values):
+    """Converts sprint field values (lists of greenhopper sprint strings) to
+    comma-separated names of all sprints. Empty values unchanged.
+    """
+    if len(SPRINT_MEMO) > 10000:
+        SPRINT_MEMO.clear()
+    results = []
+    for value in values:
+        if value:
+            key = tuple(value)
+            if key not in SPRINT_MEMO:
+                SPRINT_MEMO[key] = ",".join([name for text in key for name in SPRINT_NAME.findall(text)])
+            value = SPRINT_MEMO[key]
+        results.append(value)
+    return results
+
+register_column_fn("sprint names", sprint_names)
+
+
+#Extraction functions used in worker process (see init_extract_worker())
+WORKER_ACCESSORS = []
+#Raw issue details shared with worker processes. Set before processes started
+#so they get a copy without it having to be sent to them (not on Windows)
+WORKER_RAWS = []
+
+def init_extract_worker(mapping):
+    """
+    Creates extraction functions in worker process used by JiraComm.extract_raws()
+    Args:
+        mapping - list of (column heading, attribute, reprocess function name or None)
+    """
+    global WORKER_ACCESSORS
+    WORKER_ACCESSORS = [(heading, raw_field_accessor(attr, REPROCESS_FNS[name] if name else None))
+                        for heading, attr, name in mapping]
+
+
+def extract_raw_chunk(raws):
+    """
+    Extracts details from list of raw issue details in worker process
+    Args:
+        raws - list of raw issue details or (start, end) range of WORKER_RAWS
+    Returns:
+        list of tuples of details in same order as raws (values in same
+        order as WORKER_ACCESSORS, as tuples quicker to send back than dictionaries)
+    """
+    if isinstance(raws, tuple):
+        raws = WORKER_RAWS[raws[0]:raws[1]]
+    accessors = [accessor for heading, accessor in WORKER_ACCESSORS]
+    return [tuple([accessor(raw) for accessor in accessors]) for raw in raws]
+
+
+class ResultRow(object):
+    """
+    Extracted details of an issue. Used like a dictionary keyed by column
+    heading but uses much less memory as values held in list in heading order.
+    Only the headings of its field mapping can be used. Create using
+    result_row_type() rather than directly.
+    args:
+        data - list of values in heading order (all None if not given)
+    """
+    __slots__ = ("data",)
+    #Set by result_row_type()
+    headings = ()
+    positions = {}
+
+    def __init__(self, data=None):
+        if data is None:
+            data = [None]*len(self.headings)
+        self.data = data
+
+    def __getitem__(self, heading):
+        return self.data[self.positions[heading]]
+
+    def __setitem__(self, heading, value):
+        self.data[self.positions[heading]] = value
+
+    def __contains__(self, heading):
+        return heading in self.positions
+
+    def __iter__(self):
+        return iter(self.headings)
+
+    def __len__(self):
+        return len(self.headings)
+
+    def __eq__(self, other):
+        #Only compared with other mappings (ResultRow or dictionary)
+        if not hasattr(other, "items"):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return NotImplemented
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get(self, heading, default=None):
+        position = self.positions.get(heading)
+        return default if position is None else self.data[position]
+
+    def keys(self):
+        return list(self.headings)
+
+    def values(self):
+        return list(self.data)
+
+    def items(self):
+        return zip(self.headings, self.data)
+
+    def copy(self):
+        return self.__class__(list(self.data))
+
+
+#ResultRow types already created {headings:type}
+ROW_TYPES = {}
+
+def result_row_type(headings):
+    """
+    Returns ResultRow type for list of column headings. Created when first
+    needed, after which the same type is returned for the same headings.
+    """
+    headings = tuple(headings)
+    if headings not in ROW_TYPES:
+        ROW_TYPES[headings] = type("ResultRow", (ResultRow,), {"__slots__":(), "headings":headings,
+                                   "positions":dict((heading, i) for i, heading in enumerate(headings))})
+    return ROW_TYPES[headings]
+
+
+class RawPage(list):
+    """
+    List of raw issue details from a page of search results retrieved as
+    JSON. Like list returned by JIRA.search_issues(), has total attribute
+    giving total number of results available.
+    args:
+        result - dictionary returned by JIRA.search_issues(json_result=True)
+    """
+    def __init__(self, result):
+        list.__init__(self, result.get("issues", []))
+        self.total = result.get("total", len(self))
+
+
 class JiraComm:
     """
     Connects to LAA Jira
@@ -161,21 +671,48 @@ class JiraComm:
                             Value is function from self.reprocess
         excel_file_start - optional beggining of excel filename for results file
                             (end of filename, includes date/time is automatic)
+        snapshot_folder - optional folder in which project snapshots are saved
+                            (used by incremental retrieval). Only accepts one level.
+        cache_file - optional filename of on-disk issue cache (see IssueCache).
+                            No cache used when not set.
+        cache_ttl - seconds for which cached details are used before being
+                            retrieved from Jira again
+        cache_size - maximum number of issues held in cache
+        write_only - when True spreadsheet created in write-only mode (see ExcelSheet)
+        stats - when True collect timings and counts for the run in self.stats (see RunStats)
+        server - URL of Jira server
+        project_ttl - seconds before project details looked up in Jira again
+        pool_size - maximum number of connections to Jira kept open (see shared_adapter())
     """
     def __init__(self, username, password, folder="Results",
-                field_mapping="", reprocess_mapping={}, excel_file_start="Results"):
+                field_mapping="", reprocess_mapping={}, excel_file_start="Results",
+                snapshot_folder="Snapshots", cache_file="", cache_ttl=3600, cache_size=100000,
+                write_only=False, stats=False, server="https://legalaid.atlassian.net",
+                project_ttl=3600, pool_size=10):
         #Jira access parameters
         username = username
         password = password
-        options =  {'server': 'https://legalaid.atlassian.net'}
+        options =  {'server': server}
         #Results folder
         self.results_folder = folder
         #Set excel filename
         self.excel_filename = excel_file_start + time.strftime("_%d_%m_%Y(%H.%M.%S).xlsx")
         #Full path to the Excel file
         self.excel_file = os.path.join(self.results_folder, self.excel_filename)
+        #Folder holding project snapshots used by incremental retrieval
+        self.snapshot_folder = snapshot_folder
+        #Optional on-disk cache of issue details
+        if cache_file:
+            self.cache = IssueCache(cache_file, ttl=cache_ttl, max_issues=cache_size)
+        else:
+            self.cache = None
         #create ExcelSheet object using the above
-        self.excel = ExcelSheet(filename=self.excel_file, newfile=True, tabrename="Info")
+        self.excel = ExcelSheet(filename=self.excel_file, newfile=True, tabrename="Info", write_only=write_only)
+        #Timings and counts for the run (does nothing unless stats True)
+        self.stats = RunStats(enabled=stats)
+        self.excel.stats = self.stats
+        #Writes reports (ExcelSheet, CsvExporter or ParquetExporter)
+        self.exporter = self.excel
 
         # Extracted details defined a list of tuples (list of lists would work too)
         #   1st [0] - meaningful name/spreadsheet column heading to give to the item.
@@ -217,29 +754,111 @@ class JiraComm:
         #Holds results extracted from Jira issue objects (should be easier to handle than self.issues)
         self.extracted_results = []
 
+        #ResultStore holding self.extracted_results (see self.results_store())
+        self.store = None
+        self.store_source = None
+
+        #Results of each project when several retrieved together
+        #{project code:{"project","name","runtime","complete","issues","extracted_results"}}
+        #(see self.get_project_issues())
+        self.project_runs = {}
+
         #Holds some details of most recent run (time run, project code, project name)
         self.latest_runtime =  ""
         self.latest_proj_code = ""
         self.latest_proj_name = ""
+        self.latest_complete = True
+
+        #Search retry settings. Searches failing with these status codes
+        #are retried up to self.max_retries times. The jira module's session
+        #already retries 502, 503 and 504 itself, so they aren't included
+        self.retry_statuses = (429, 500)
+        self.max_retries = 5
+        #Details of each page of search results retrieved (including time taken)
+        self.page_timings = []
+        #Searches which failed to retrieve all results
+        self.incomplete = set()
+        #Whether all issues retrieved for each project {project code: bool}
+        self.complete = {}
+
+        #Large fields only retrieved when needed if headings passed to self.get_project_issues()
+        self.heavy_fields = ["description", "comment"]
+        #Headings not included in main search, so retrieved by self.report() when needed
+        self.lazy_headings = set()
+        #Values retrieved for self.lazy_headings {issue key:{heading:value}}
+        self.lazy_values = {}
+
+        #Values of these fields are mostly different for every issue so not
+        #shared between results (see self.intern_values())
+        self.unique_fields = ["key", "summary", "description", "comment", "created", "updated"]
+        #Values shared between results {value:value} (see self.intern_values())
+        self.symbols = {}
 
         #Define reprocessing (functions used to transform specified elements)
         self.define_reprocess_fns()
         self.reprocess_mapping = reprocess_mapping
 
+        #Create functions used to extract details from issues
+        self.compile_field_mapping()
+
+        #Projects available to user {project code:name}. Filled in as projects
+        #used (see self.project_name())
+        self.projects = {}
+        #Time each project looked up {project code:time}
+        self.project_checked = {}
+        self.project_ttl = project_ttl
+        self.project_lock = threading.Lock()
+
         #Try to access Jira using supplied details
         print ""
         print "* Warnings 'SNIMissingWarning' and 'InsecurePlatformWarning' are usual! *"
         print ""
         try:
-            self.jira = JIRA(options=options, basic_auth=(username,password))
+            #Use shared connection pool and count bytes received from first request
+            hooks = [self.stats.response_hook] if self.stats.enabled else []
+            self.jira = PooledJIRA(options=options, basic_auth=(username,password), get_server_info=False,
+                                   adapter=shared_adapter(pool_size), hooks=hooks)
         except JIRAError as e:
             #The error text accompanying "Unauthorized (401)" is huge and looks like HTML
             print "Access to Jira failed. Invalid username/password?"
             self.jira = None
-            self.projects = {}
-        else:
-            #find all projects available to user
-            self.projects = {proj.key:proj.name for proj in self.jira.projects()}
+
+
+    def project_name(self, project):
+        """Returns name of project or None if user cannot access it.
+        Project looked up in Jira when first used, then result remembered
+        for self.project_ttl seconds (also recorded in self.projects)
+        Args:
+            project - project code, e.g. "K008"
+        """
+        with self.project_lock:
+            if time.time() - self.project_checked.get(project, float("-inf")) < self.project_ttl:
+                return self.projects.get(project)
+        try:
+            name = self.jira.project(project).name
+        except (JIRAError, AttributeError):
+            #AttributeError when not logged in (self.jira None)
+            name = None
+        with self.project_lock:
+            if name is None:
+                self.projects.pop(project, None)
+            else:
+                self.projects[project] = name
+            self.project_checked[project] = time.time()
+        return name
+
+
+    def load_projects(self):
+        """Finds all projects available to user and records them in self.projects
+        Returns:
+            self.projects
+        """
+        projects = {proj.key:proj.name for proj in self.jira.projects()}
+        with self.project_lock:
+            now = time.time()
+            self.projects = projects
+            self.project_checked = dict.fromkeys(projects, now)
+        return self.projects
 
 
     def define_reprocess_fns(self):
@@ -252,39 +871,50 @@ class JiraComm:
         to transform the items into something more convenient. These functions
         are stored in dictionary self.reprocess. If mapped to an item by
         reprocess_mapping they will be automatically applied by self.issue_details()
+        Column transforms, which transform all the values of a column at once,
+        are stored in self.column_reprocess (see register_column_fn()).
+        Functions added directly to self.reprocess (rather than by
+        register_reprocess_fn()) can't be used by self.extract_raws() with
+        more than one process.
         """
-        self.reprocess = {}
-
-        #Re-arrange Jira date to nicer format (uses date_remformat method)
-        self.reprocess["date fix"] = self.date_reformat
-
-        #Originally created to concatenate component names into comma-separated string
-        self.reprocess["name concat"] = lambda field: ",".join([e.name for e in field])
-
-        #Latest comment
-        ##self.reprocess["latest comment"] = lambda comments: "["+comments[-1].author.displayName + ", "+self.date_reformat(comments[-1].updated) + "] "+comments[-1].body
-        def temp(comments):
-            #Sometimes comment lacks attributes such as author, so exception handling added to skip these
-            try:
-                #extract info from the latest comment
-                info = "["+comments[-1].author.displayName + ", "+self.date_reformat(comments[-1].updated) + "] "+comments[-1].body
-            except Exception as e:
-                info = ""
-            return info
-        self.reprocess["latest comment"] = temp
-
-        #Sprint name
-        #bit troublesome as issue.fields.customfield_10003 is a list containing a string, from which we only want a substring
-        # [u'com.atlassian.greenhopper.service.sprint.Sprint@1af0af6[id=4,rapidViewId=1,state=ACTIVE,name=K008 - Sprint 1,startDate=2016-02-26T11:59:42.924Z,endDate=2016-03-25T11:59:00.000Z,completeDate=<null>,sequence=4]']
-        def temp(sprint_field):
-            text = sprint_field[0]
-            start = 5 + text.find("name=")
-            end = text.find(",", start)
-            value = text[start:end]
-            return value
-        self.reprocess["sprint name"]=temp
+        #Standard functions (date fix, name concat, latest comment, sprint name)
+        #plus any added using register_reprocess_fn()
+        self.reprocess = dict(REPROCESS_FNS)
+        #Column transforms (datetime, sprint names) plus any added using register_column_fn()
+        self.column_reprocess = dict(COLUMN_FNS)
+
+    def compile_field_mapping(self):
+        """Creates function for each item in self.field_mapping which extracts
+        the item's value from a Jira issue object, with any reprocessing from
+        self.reprocess_mapping included. Stored in self.accessors as list of
+        (column heading, function) tuples. Equivalent functions for raw issue
+        details stored in self.raw_accessors. Column transforms stored in
+        self.column_transforms as list of (column heading, function) tuples.
+        Also sets self.row_type, the ResultRow type used for results.
+        Called automatically on creation. Needs to be called again if
+        self.field_mapping, self.reprocess_mapping or self.reprocess changed.
+        """
+        self.accessors = []
+        self.raw_accessors = []
+        self.column_transforms = []
+        self.row_type = result_row_type([item[0] for item in self.field_mapping])
+        #Positions of values shared between results (see self.intern_values())
+        self.intern_positions = [i for i, item in enumerate(self.field_mapping)
+                                 if item[1] not in self.unique_fields]
+        for item in self.field_mapping:
+            if self.reprocess_mapping.get(item[0]) in self.column_reprocess:
+                self.column_transforms.append((item[0], self.column_reprocess[self.reprocess_mapping[item[0]]]))
+                fn = None
+            elif item[0] in self.reprocess_mapping:
+                fn = self.reprocess[self.reprocess_mapping[item[0]]]
+            else:
+                fn = None
+            self.accessors.append((item[0], field_accessor(item[2], fn)))
+            self.raw_accessors.append((item[0], raw_field_accessor(item[2], fn)))
 
-    def get_project_issues(self, project, clear_old=True, fields=None, max_results=1000):
+    def get_project_issues(self, project, clear_old=True, fields=None, max_results=1000, workers=1,
+                            incremental=False, raw=False, headings=None, extract_processes=1,
+                            paging="offset"):
         """Get list containing all issues associated with the chosen project.
         Store results in self.issues.
         Search string uses JQL (Jira query lang that is)
@@ -292,7 +922,10 @@ class JiraComm:
         but search will automatically repeat if maximum number exceded.
 
         Args:
-            project - project code, e.g. "K008"
+            project - project code, e.g. "K008", or list of project codes.
+            Issues of several projects are retrieved by one search then split
+            by project into self.project_runs (see self.use_project()).
+            self.issues and self.extracted_results hold those of all of them.
             clear_old (bool) - when true, self.issues cleared before adding new
             fields - optional fields included in search results as comma
             separated string, e.g. "key,summary,priority". If None the default
@@ -301,57 +934,764 @@ class JiraComm:
             max_results - maximum amount of results to retrieve at a time. Jira
             itself has a limit of 1000. If number of results exceedes maximum
             search will keep repeating until all retrieved.
+            workers - number of pages of results to retrieve at the same time.
+            When 1 (default) pages are retrieved one after another.
+            incremental (bool) - when True only retrieve issues updated since
+            the last incremental run and merge them into the saved snapshot of
+            the project. self.issues then holds the whole merged snapshot.
+            Note issues deleted from Jira remain in the snapshot. If not all
+            changes retrieved they are merged but the snapshot isn't saved.
+            raw (bool) - when True retrieve raw details of issues rather than
+            Jira issue objects and extract details from them directly.
+            Quicker and uses less memory. Only self.extracted_results updated.
+            (self.issues is left empty).
+            headings - optional list of all headings to be used by reports. When
+            set (and fields not set), only the fields needed for these headings
+            are retrieved. Large fields (self.heavy_fields) are left out and
+            retrieved by self.report() only for the results it writes.
+            extract_processes - number of processes used to extract details
+            (see self.extract_raws())
+            paging - "offset" (default) retrieves pages by position.
+            "keyset" retrieves issues in key order, each page starting after
+            the last key received (see self.iter_pages_keyset()). With more
+            than one worker the project is split into ranges of issue number
+            retrieved at the same time (see self.search_ranges_parallel()).
+            Only for one project ("offset" used for several).
         """
+        #Work out fields needed for headings
+        fields = self.prune_fields(headings, fields)
+
         if clear_old:
             self.issues = []
+            if raw:
+                self.extracted_results = []
+
+        #Several projects given
+        projects = None if isinstance(project, basestring) else list(project)
+
+        #Set the runtime, project and project code
+        self.latest_runtime =  time.strftime("%d/%m/%Y (%H:%M:%S)")
+        if projects is None:
+            self.latest_proj_code = project
+            self.latest_proj_name = self.project_name(project) or ""
+        else:
+            self.latest_proj_code = ",".join(projects)
+            self.latest_proj_name = ", ".join([self.project_name(code) or code for code in projects])
+
+        #Get the issues
+        issues = self.retrieve_project_issues(project, fields=fields, max_results=max_results,
+                            workers=workers, incremental=incremental, raw=raw, paging=paging)
+        if projects is None:
+            self.latest_complete = self.complete.get(project, True)
+        else:
+            self.latest_complete = all([self.complete.get(code, True) for code in projects])
+            #Put issues in project order
+            by_project = self.split_by_project(issues, projects)
+            issues = list(itertools.chain.from_iterable([by_project[code] for code in projects]))
+
+        #Extract details from results and store in list of dictionaries
+        if raw:
+            with self.stats.timer("Extract details"):
+                self.extracted_results.extend(self.extract_raws(issues, extract_processes))
+            self.stats.count("Issues extracted", len(issues))
+        else:
+            self.issues.extend(issues)
+            self.extract_info(extract_processes)
+
+        #Record results of each project separately (new results at end of self.extracted_results)
+        if projects is not None:
+            results = self.extracted_results[len(self.extracted_results)-len(issues):]
+            self.project_runs = {}
+            for code in projects:
+                count = len(by_project[code])
+                self.project_runs[code] = {"project":code, "name":self.projects.get(code, ""),
+                                           "runtime":self.latest_runtime, "complete":self.complete.get(code, True),
+                                           "issues":[] if raw else by_project[code],
+                                           "extracted_results":results[:count]}
+                results = results[count:]
+
+    def split_by_project(self, issues, projects):
+        """Splits issues into lists for each project, keeping their order
+        Args:
+            issues - list of Jira issue objects or raw issue details
+            projects - list of project codes
+        Returns:
+            dictionary {project code:list of issues}
+        """
+        by_project = dict((code, []) for code in projects)
+        for issue in issues:
+            by_project.setdefault(field_value(issue, "key").rsplit("-", 1)[0], []).append(issue)
+        return by_project
+
+    def use_project(self, project):
+        """Sets self.issues, self.extracted_results and details of latest run
+        to those of one of the projects retrieved together by
+        self.get_project_issues() (held in self.project_runs), e.g. so it
+        can be reported on by self.report()
+        Args:
+            project - project code, e.g. "K008"
+        Returns:
+            details of project's run (dictionary)
+        """
+        run = self.project_runs[project]
+        self.issues = run["issues"]
+        self.extracted_results = run["extracted_results"]
+        self.latest_runtime = run["runtime"]
+        self.latest_proj_code = project
+        self.latest_proj_name = run["name"]
+        self.latest_complete = run["complete"]
+        return run
+
+    def prune_fields(self, headings, fields=None):
+        """Works out fields needed for headings, leaving out large fields
+        (self.heavy_fields). Headings using these are recorded in
+        self.lazy_headings so self.report() can retrieve them when needed.
+        Args:
+            headings - list of headings used by reports (if not set, fields returned unchanged)
+            fields - fields to use if set (no pruning done)
+        Returns:
+            fields as comma separated string
+        """
+        self.lazy_headings = set()
+        self.lazy_values = {}
+        if fields or not headings:
+            return fields
+
+        needed = []
+        for item in self.field_mapping:
+            if item[0] not in headings:
+                continue
+            if item[1] in self.heavy_fields:
+                self.lazy_headings.add(item[0])
+            elif item[1] not in needed:
+                needed.append(item[1])
+        return ",".join(needed)
+
+    def key_heading(self):
+        """Returns heading of the issue key (from self.field_mapping) or None if not mapped"""
+        for item in self.field_mapping:
+            if item[1] == "key":
+                return item[0]
+        return None
+
+    def fill_lazy(self, results, headings):
+        """Adds values of headings left out of the main search (see
+        self.prune_fields()) to results, retrieving them from Jira in bulk
+        when not already retrieved. Results are updated in place.
+        If some issues can't be retrieved self.latest_complete set False.
+        Args:
+            results - list of results (dictionaries of issue details)
+            headings - list of headings to fill (from self.lazy_headings)
+        """
+        key_heading = self.key_heading()
+        if not key_heading:
+            print "Can't get",headings,"because issue key not in field mapping."
+            return
+
+        #Get details of issues not already retrieved (all lazy headings at once)
+        keys = [result.get(key_heading) for result in results]
+        keys = [key for key in set(keys) if key and key not in self.lazy_values]
+        if keys:
+            fields = ",".join(set([item[1] for item in self.field_mapping if item[0] in self.lazy_headings]))
+            accessors = [(heading, accessor) for heading, accessor in self.raw_accessors if heading in self.lazy_headings]
+            for page in self.search_keys(keys, fields, raw=True):
+                values = [dict((heading, accessor(raw)) for heading, accessor in accessors) for raw in page]
+                for raw, details in itertools.izip(page, self.transform_columns(values)):
+                    self.lazy_values[raw["key"]] = details
+
+            #Report marked incomplete if some issues couldn't be retrieved
+            missing = [key for key in keys if key not in self.lazy_values]
+            if missing:
+                print "WARNING: Could not retrieve",",".join(headings),"for",len(missing),"issues"
+                self.latest_complete = False
+
+        for result in results:
+            values = self.lazy_values.get(result.get(key_heading), {})
+            for heading in headings:
+                if heading in values:
+                    result[heading] = values[heading]
+
+    def search_keys(self, keys, fields, raw=False, batch_size=100, workers=4):
+        """Retrieves issues by key using "key in (...)" searches of up to
+        batch_size issues, several searches at a time. Each search is paged
+        by self.iter_pages() in case Jira returns fewer results per page than
+        batch_size, and any search not fully retrieved is added to
+        self.incomplete. Searches aren't validated, so keys of issues no
+        longer in Jira are left out rather than failing the whole batch.
+        Args:
+            keys - list of issue keys
+            fields - fields included in search results as comma separated string
+            raw (bool) - when True get raw issue details instead of Jira issue objects
+            batch_size - maximum number of issues retrieved by each search
+            workers - maximum number of searches at the same time
+        Returns:
+            list of pages of search results (see self.search_page())
+        """
+        if not keys:
+            return []
+
+        def fetch(batch):
+            search_string = "key in (" + ",".join(['"%s"' % key for key in batch]) + ")"
+            self.incomplete.discard(search_string)
+            return list(self.iter_pages(search_string, fields, len(batch), raw, validate_query=False))
+
+        batches = [keys[i:i+batch_size] for i in range(0, len(keys), batch_size)]
+        pool = ThreadPool(min(workers, len(batches)))
+        try:
+            #map() returns pages of each batch in same order as batches
+            return list(itertools.chain.from_iterable(pool.map(fetch, batches)))
+        finally:
+            pool.close()
+            pool.join()
+
+    def retrieve_project_issues(self, project, fields=None, max_results=1000, workers=1,
+                            incremental=False, raw=False, paging="offset"):
+        """Retrieves all issues associated with the chosen project and returns
+        them. Unlike self.get_project_issues() does not update self.issues,
+        details of the latest run or self.extracted_results so can be used
+        for several projects at once (see self.build_reports()).
+
+        Whether all issues were retrieved is recorded in self.complete.
+
+        Args:
+            as for self.get_project_issues(). If project is list of project
+            codes, issues of all of them retrieved by one search (but not
+            split by project)
+        Returns:
+            list of Jira issue objects (list of raw issue details if raw True)
+        """
+        issues = []
+
+        #Several projects retrieved using one search
+        projects = [project] if isinstance(project, basestring) else list(project)
+        if len(projects) == 1:
+            project = projects[0]
+        else:
+            if incremental:
+                print "Incremental retrieval only available for one project at a time. Retrieving all issues."
+                incremental = False
+            if paging == "keyset":
+                print "Keyset paging only available for one project at a time. Using offset paging."
+                paging = "offset"
+        available = [code for code in projects if self.project_name(code) is not None]
 
         #Default fields
         if not fields:
             fields = ",".join([e[1] for e in self.field_mapping])
 
-        #Record to start retrieving from (used to retrieve results in batches)
-        start_at = 0
+        #Incremental retrieval needs updated field to find latest change
+        if incremental and "updated" not in fields.split(","):
+            fields = fields + ",updated"
+
+        #True once issues retrieved from Jira (rather than from cache)
+        fetched = False
 
-        #Controls while loop that retrieves results
+        #Controls whether results retrieved
         keep_going = True
 
         #Set the project but abandon if user cannot access it.
-        if project in self.projects:
+        if len(projects) > 1 and available:
+            search_string = "project in (" + ",".join(available) + ")"
+            print "***",search_string,"***"
+            self.incomplete.discard(search_string)
+            for code in projects:
+                if code not in available:
+                    print "User has no access to project:",code
+        elif available:
             search_string = "project="+project
+            #Only get changes since last run when we have a usable snapshot
+            if incremental:
+                snapshot = self.load_snapshot(project, fields)
+                if snapshot["last_updated"]:
+                    search_string = search_string + ' AND updated >= "%s"' % self.jql_date(snapshot["last_updated"])
             print "***",search_string,"***"
+            self.incomplete.discard(search_string)
         else:
-            print "User has no access to project:",project
+            print "User has no access to project:",",".join(projects)
             keep_going = False
 
-        #Set the runtime, project and project code
-        self.latest_runtime =  time.strftime("%d/%m/%Y (%H:%M:%S)")
-        self.latest_proj_code = project
-        self.latest_proj_name = self.projects[project]
+        #Use cached search results if recent enough (not for incremental
+        #retrieval as the snapshot already does the same job)
+        if keep_going and self.cache and not incremental:
+            raws = self.cache.get_search(search_string, fields)
+            if raws is not None:
+                issues = raws if raw else [self.issue_from_raw(issue) for issue in raws]
+                keep_going = False
+                print "Using cached issues. Found:",len(issues)
+
+        #Get all pages at once if more than one worker
+        if keep_going and workers > 1:
+            if paging == "keyset":
+                issues = self.search_ranges_parallel(search_string, fields, max_results, workers, raw)
+            else:
+                issues = self.search_pages_parallel(search_string, fields, max_results, workers, raw)
+            keep_going = False
+            print "Finished retrieving issues. Found:",len(issues)
+            fetched = True
 
         #Get results from Jira
-        while keep_going:
-            print "Retrieving issues in range: %i, %i" %(start_at, start_at+max_results)
+        if keep_going:
+            if paging == "keyset":
+                pages = self.iter_pages_keyset(search_string, fields, max_results, raw)
+            else:
+                pages = self.iter_pages(search_string, fields, max_results, raw)
+            for page in pages:
+                #Add the batch of issues
+                issues.extend(page)
+            print "Finished retrieving issues. Found:",len(issues)
+            fetched = True
+
+        #Don't keep incomplete results (not cached, snapshot not saved)
+        complete = not (fetched and search_string in self.incomplete)
+        if not complete:
+            print "WARNING: Not all issues retrieved for project:",",".join(projects)
+            fetched = False
+        for code in projects:
+            self.complete[code] = complete
+
+        #Store newly retrieved issues in cache
+        if self.cache and fetched:
+            self.cache.put_search(search_string, fields, issues if raw else [issue.raw for issue in issues])
+
+        #Merge new issues into snapshot, then use the whole snapshot.
+        #Partial changes are only merged in memory, so the next run gets
+        #everything changed since the last complete one.
+        if incremental and project in self.projects:
+            issues = self.merge_snapshot(snapshot, issues, raw)
+            if complete:
+                self.save_snapshot(project, snapshot)
+            else:
+                print "Snapshot not saved as not all changes retrieved"
+            print "Issues in snapshot:",len(snapshot["issues"])
+
+        return issues
+
+    def build_reports(self, projects, writer, fetch_workers=3, combined=False, **kwargs):
+        """Retrieves the issues of several projects and writes reports for them.
+        Projects are retrieved (and their details extracted) in parallel while
+        reports for projects already retrieved are written. Reports are
+        written one project at a time, in the same order as projects.
+
+        Args:
+            projects - list of project codes, e.g. ["GB","K008"]
+            writer - function which writes the reports for one project. Called as
+                writer(project, index) where index is position of project in
+                projects. When called self.issues, self.extracted_results and
+                details of latest run are set for that project.
+            fetch_workers - maximum number of projects retrieved at the same time
+            combined (bool) - when True issues of all projects retrieved by one
+                search (see self.get_project_issues()) before any reports written
+            Other keyword arguments (fields, max_results, workers, incremental, raw, paging)
+            are passed to self.retrieve_project_issues(). headings keyword
+            argument can be used as with self.get_project_issues()
+        """
+        if combined:
+            self.get_project_issues(projects, **kwargs)
+            for index, project in enumerate(projects):
+                self.use_project(project)
+                writer(project, index)
+            return
+
+        raw = kwargs.get("raw", False)
+        kwargs["fields"] = self.prune_fields(kwargs.pop("headings", None), kwargs.get("fields"))
+        def fetch(project):
+            runtime = time.strftime("%d/%m/%Y (%H:%M:%S)")
+            issues = self.retrieve_project_issues(project, **kwargs)
+            with self.stats.timer("Extract details"):
+                results = self.extract_details(issues, raw)
+                if raw:
+                    issues = []
+            self.stats.count("Issues extracted", len(results))
+            return project, runtime, issues, results
+
+        if not projects:
+            return
+        pool = ThreadPool(min(fetch_workers, len(projects)))
+        try:
+            #imap() returns each project as soon as it and all those before it are ready
+            for index, (project, runtime, issues, results) in enumerate(pool.imap(fetch, projects)):
+                self.issues = issues
+                self.extracted_results = results
+                self.latest_runtime = runtime
+                self.latest_proj_code = project
+                self.latest_proj_name = self.projects.get(project, "")
+                self.latest_complete = self.complete.get(project, True)
+                writer(project, index)
+        finally:
+            pool.close()
+            pool.join()
+
+    def snapshot_filename(self, project):
+        """Returns path of the snapshot file for a project
+        Args:
+            project - project code, e.g. "K008"
+        """
+        return os.path.join(self.snapshot_folder, project+"_snapshot.json")
+
+    def load_snapshot(self, project, fields):
+        """Loads saved snapshot of project's issues.
+        Snapshot is a dictionary containing:
+            "fields" - fields retrieved for the issues
+            "last_updated" - latest updated value of the issues (Jira format)
+            "issues" - list of raw issue details (as returned by Jira)
+        Args:
+            project - project code, e.g. "K008"
+            fields - fields to be retrieved as comma separated string. Saved
+            snapshot ignored if it was made using different fields.
+        Returns:
+            snapshot dictionary (empty snapshot if none saved or saved one
+            can't be read)
+        """
+        snapshot = {"fields":fields, "last_updated":"", "issues":[]}
+        filename = self.snapshot_filename(project)
+        if os.path.exists(filename):
             try:
-                issues = self.jira.search_issues(search_string, fields=fields, maxResults=max_results, startAt=start_at)
+                with open(filename) as f:
+                    saved = json.load(f)
+                saved_fields = saved["fields"]
+            except (ValueError, KeyError, TypeError) as e:
+                print "Snapshot ignored because it can't be read:",filename,e
+            else:
+                if saved_fields == fields:
+                    snapshot = saved
+                else:
+                    print "Snapshot ignored because fields have changed:",filename
+        return snapshot
+
+    def save_snapshot(self, project, snapshot):
+        """Saves snapshot of project's issues (see self.load_snapshot())
+        Args:
+            project - project code, e.g. "K008"
+            snapshot - snapshot dictionary
+        """
+        if not os.path.exists(self.snapshot_folder):
+            os.mkdir(self.snapshot_folder)
+        #Write to temporary file then rename, so a run killed while saving
+        #leaves the previous snapshot rather than half of a new one
+        filename = self.snapshot_filename(project)
+        with open(filename+".tmp", "w") as f:
+            json.dump(snapshot, f)
+        #Windows can't rename over an existing file
+        if sys.platform == "win32" and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(filename+".tmp", filename)
+
+    def merge_snapshot(self, snapshot, issues, raw=False):
+        """Merges newly retrieved issues into snapshot by issue key.
+        Changed issues replace the snapshot version, new issues are added to
+        the start (same place Jira puts them). snapshot["last_updated"] is
+        updated to latest value found.
+        Args:
+            snapshot - snapshot dictionary (see self.load_snapshot())
+            issues - list of newly retrieved Jira issue objects
+            raw (bool) - True if issues are raw issue details rather than
+            Jira issue objects
+        Returns:
+            list of Jira issue objects for every issue in updated snapshot
+            (raw issue details if raw True)
+        """
+        new_raw = issues if raw else [issue.raw for issue in issues]
+        new_keys = set([issue_raw["key"] for issue_raw in new_raw])
+        snapshot["issues"] = new_raw + [issue_raw for issue_raw in snapshot["issues"]
+                                        if issue_raw["key"] not in new_keys]
+
+        #Jira dates sort correctly as strings
+        for issue_raw in new_raw:
+            updated = issue_raw["fields"].get("updated") or ""
+            if updated > snapshot["last_updated"]:
+                snapshot["last_updated"] = updated
+
+        #Re-create issue objects from raw details
+        if raw:
+            return list(snapshot["issues"])
+        return [self.issue_from_raw(issue) for issue in snapshot["issues"]]
+
+    def issue_from_raw(self, raw):
+        """Creates Jira issue object from raw issue details (as held in
+        issue.raw), e.g. from snapshot or cache.
+        Args:
+            raw - dictionary of raw issue details
+        Returns:
+            Jira issue object
+        """
+        return Issue(self.jira._options, self.jira._session, raw=raw)
+
+    def search_page(self, search_string, fields, start_at, max_results, raw=False, validate_query=True):
+        """Retrieves a single page of search results from Jira
+        Args:
+            search_string - JQL search string, e.g. "project=K008"
+            fields - fields included in search results as comma separated string
+            start_at - index of first result to retrieve
+            max_results - maximum number of results to retrieve
+            raw (bool) - when True get raw issue details instead of Jira issue objects
+            validate_query (bool) - when False Jira ignores unknown values in
+            search rather than failing (e.g. keys of deleted issues)
+        Search retried if Jira returns one of self.retry_statuses (e.g. 429 Too Many Requests).
+        If search fails search_string added to self.incomplete.
+        Details of the page, including time taken, added to self.page_timings.
+
+        Returns:
+            list of Jira issue objects (empty if search failed). When returned
+            by Jira, list also has total attribute giving total number of
+            results available.
+        """
+        print "Retrieving issues in range: %i, %i" %(start_at, start_at+max_results)
+        attempts = 0
+        started = time.time()
+        while True:
+            attempts += 1
+            self.stats.count("Jira searches")
+            try:
+                if raw:
+                    issues = RawPage(self.jira.search_issues(search_string, fields=fields, maxResults=max_results,
+                                                             startAt=start_at, validate_query=validate_query,
+                                                             json_result=True))
+                else:
+                    issues = self.jira.search_issues(search_string, fields=fields, maxResults=max_results,
+                                                     startAt=start_at, validate_query=validate_query)
             except JIRAError as e:
-                print "Jira Error when searching for Project's issues.",self.issues,e
-                keep_going = False
+                status = getattr(e, "status_code", None)
+                if status in self.retry_statuses and attempts <= self.max_retries:
+                    wait = self.retry_wait(e, attempts)
+                    print "Jira Error %s, retrying in %.1f seconds" % (status, wait)
+                    time.sleep(wait)
+                    continue
+                print "Jira Error when searching for Project's issues.",e
+                self.incomplete.add(search_string)
                 issues = []
+            break
+
+        seconds = time.time()-started
+        self.page_timings.append({"search":search_string, "start_at":start_at, "issues":len(issues),
+                                  "attempts":attempts, "seconds":seconds})
+        self.stats.add_time("Jira search", seconds)
+        self.stats.count("Pages retrieved")
+        self.stats.count("Issues retrieved", len(issues))
+        return issues
+
+    def count_issues(self, searches, workers=8):
+        """Finds number of issues matching each of list of JQL searches
+        without retrieving any issues (searches use maxResults=0 so Jira only
+        returns the total). Searches run at the same time.
+        Args:
+            searches - list of JQL search strings
+            workers - maximum number of searches at the same time
+        Returns:
+            list of counts in same order as searches (None if search failed)
+        """
+        def count(search_string):
+            self.incomplete.discard(search_string)
+            page = self.search_page(search_string, "key", 0, 0, raw=True)
+            return getattr(page, "total", None)
+
+        if not searches:
+            return []
+        pool = ThreadPool(min(workers, len(searches)))
+        try:
+            #Jira warns that not all issues fetched, which is the point here.
+            #Filter set once around all the searches (catch_warnings isn't thread safe)
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", "All issues cannot be fetched at once")
+                return pool.map(count, searches)
+        finally:
+            pool.close()
+            pool.join()
+
+    def priority_counts(self, project, statuses, priorities, workers=8):
+        """Counts issues of project with each priority and one of statuses,
+        using self.count_issues() (so issues not retrieved)
+        Args:
+            project - project code, e.g. "K008"
+            statuses - list of statuses, e.g. ["New Bug", "In Test"]
+            priorities - list of priorities, e.g. ["P1 V. High", "P2 High"]
+            workers - maximum number of searches at the same time
+        Returns:
+            dictionary {priority:count} (count None if search failed)
+        """
+        search_string = 'project="%s" AND status in (%s)' % (project, ",".join(['"%s"' % status for status in statuses]))
+        searches = [search_string + ' AND priority="%s"' % priority for priority in priorities]
+        return dict(zip(priorities, self.count_issues(searches, workers)))
+
+    def retry_wait(self, error, attempts):
+        """Returns number of seconds to wait before retrying failed search.
+        Uses value of Retry-After header when Jira supplies one, otherwise
+        doubles with each attempt (1, 2, 4...) up to 60 seconds.
+        Args:
+            error - JIRAError from failed search
+            attempts - number of attempts made so far
+        """
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return min(2 ** (attempts-1), 60)
 
-            #Add the batch of issues to self.issues
-            self.issues = self.issues + issues
-
-            #If length of issues == max_results need to do further search to see if there
-            #are any more results. Increase start_at value for next search
-            if len(issues) == max_results:
-                start_at = start_at + max_results
+    def iter_pages(self, search_string, fields, max_results, raw=False, validate_query=True):
+        """Generator which retrieves pages of search results one at a time,
+        until all retrieved.
+        Args:
+            search_string - JQL search string, e.g. "project=K008"
+            fields - fields included in search results as comma separated string
+            max_results - maximum number of results in each page
+            raw (bool) - when True get raw issue details instead of Jira issue objects
+            validate_query (bool) - as for self.search_page()
+        Yields:
+            each page (as returned by self.search_page())
+        If not all results retrieved search_string added to self.incomplete.
+        """
+        #Record to start retrieving from
+        start_at = 0
+        total = None
+        while True:
+            page = self.search_page(search_string, fields, start_at, max_results, raw, validate_query)
+            yield page
+            #Next search starts after the results received
+            start_at = start_at + len(page)
+            total = getattr(page, "total", None)
+            if total is None:
+                #Total unknown (search failed), a full page means there may be more
+                if len(page) < max_results:
+                    break
             #Stop if no further results
-            else:
-                keep_going = False
-                print "Finished retrieving issues. Found:",len(self.issues)
-
-        #Extract details from results and store in list of dictionaries
-        self.extract_info()
+            elif not page or start_at >= total:
+                break
+            #Jira can return fewer results per page than asked for, so use its page size
+            elif len(page) < max_results:
+                print "Jira page size is",len(page)
+                max_results = len(page)
+
+        if total is not None and start_at < total:
+            self.incomplete.add(search_string)
+
+    def issue_number(self, issue):
+        """Returns number from key of Jira issue object or raw issue details,
+        e.g. 17 for "K008-17" """
+        return int(field_value(issue, "key").rsplit("-", 1)[1])
+
+    def iter_pages_keyset(self, search_string, fields, max_results, raw=False, number_range=None):
+        """Generator like self.iter_pages() but pages by issue key rather than
+        position. Results ordered by key and each page after the first asks
+        for issues with key after the last one received, so every page
+        takes Jira the same effort and issues added or changed while paging
+        can't be missed or repeated.
+        Only for searches of one project: JQL compares keys by issue number
+        only within a project. (id can't be used instead: in JQL it is
+        another name for key, so "id > 10100" and "ORDER BY id" are
+        comparisons of keys, not of issue ids.)
+        Args:
+            as for self.iter_pages() (search_string mustn't include ORDER BY), plus
+            number_range - optional (project, lowest number, highest number)
+            tuple. Only issues with key numbers in this range retrieved.
+        Yields:
+            each page (as returned by self.search_page())
+        If not all results retrieved search_string added to self.incomplete.
+        """
+        last_key = None
+        while True:
+            page_search = search_string
+            if number_range:
+                page_search = page_search + ' AND key >= "%s-%i" AND key <= "%s-%i"' % (
+                    number_range[0], number_range[1], number_range[0], number_range[2])
+            if last_key is not None:
+                page_search = page_search + ' AND key > "%s"' % last_key
+            page_search = page_search + " ORDER BY key ASC"
+
+            page = self.search_page(page_search, fields, 0, max_results, raw)
+            #Failed searches recorded against whole search
+            if page_search in self.incomplete:
+                self.incomplete.discard(page_search)
+                self.incomplete.add(search_string)
+                yield page
+                break
+            yield page
+
+            #Total is number of issues after last_key, so stop when all received
+            if not page or len(page) >= getattr(page, "total", len(page)):
+                break
+            last_key = field_value(page[-1], "key")
+
+    def search_ranges_parallel(self, search_string, fields, max_results, workers, raw=False):
+        """Retrieves all search results of one project by splitting them into
+        ranges of issue number, retrieved at the same time, each using
+        self.iter_pages_keyset(). First and last keys found first (one issue
+        searches).
+        Args:
+            as for self.search_pages_parallel()
+        Returns:
+            list of Jira issue objects (or raw details) in order of key
+        """
+        #Find first and last keys
+        ends = []
+        for order in ("ASC", "DESC"):
+            end_search = search_string + " ORDER BY key " + order
+            page = self.search_page(end_search, "key", 0, 1, raw=True)
+            if end_search in self.incomplete:
+                self.incomplete.discard(end_search)
+                self.incomplete.add(search_string)
+            ends.append(page[0] if page else None)
+        if None in ends:
+            return []
+
+        #Split issue numbers into one range per worker
+        project = ends[0]["key"].rsplit("-", 1)[0]
+        low, high = [self.issue_number(issue) for issue in ends]
+        step = (high - low) // workers + 1
+        number_ranges = [(project, start, min(start+step-1, high)) for start in xrange(low, high+1, step)]
+
+        def fetch(number_range):
+            issues = []
+            for page in self.iter_pages_keyset(search_string, fields, max_results, raw, number_range):
+                issues.extend(page)
+            return issues
+
+        pool = ThreadPool(len(number_ranges))
+        try:
+            #map() returns ranges in same order as number_ranges
+            ranges = pool.map(fetch, number_ranges)
+        finally:
+            pool.close()
+            pool.join()
+        return list(itertools.chain.from_iterable(ranges))
+
+    def search_pages_parallel(self, search_string, fields, max_results, workers, raw=False):
+        """Retrieves all pages of search results, several at a time.
+        First page retrieved on its own to find the total number of results,
+        then the remaining pages are retrieved using a pool of threads.
+        Args:
+            search_string - JQL search string, e.g. "project=K008"
+            fields - fields included in search results as comma separated string
+            max_results - maximum number of results in each page
+            workers - maximum number of pages retrieved at the same time
+            raw (bool) - when True get raw issue details instead of Jira issue objects
+        Returns:
+            list of Jira issue objects in same order as sequential retrieval
+        """
+        first_page = self.search_page(search_string, fields, 0, max_results, raw)
+        issues = list(first_page)
+        total = getattr(first_page, "total", len(first_page))
+
+        #Jira can return fewer results per page than asked for, so use its page size
+        if len(first_page) < max_results and len(first_page) < total:
+            print "Jira page size is",len(first_page)
+            max_results = len(first_page)
+
+        #Start positions of the remaining pages
+        offsets = range(len(first_page), total, max_results) if first_page else []
+        if offsets:
+            pool = ThreadPool(min(workers, len(offsets)))
+            try:
+                #map() returns pages in same order as offsets
+                pages = pool.map(lambda start_at: self.search_page(search_string, fields, start_at, max_results, raw), offsets)
+            finally:
+                pool.close()
+                pool.join()
+            for page in pages:
+                issues.extend(page)
+
+        if len(issues) < total:
+            self.incomplete.add(search_string)
+        return issues
 
     def get_issue(self,key):
         """Gets single issue from Jira from supplied key
@@ -362,11 +1702,19 @@ class JiraComm:
             if issue found, returns issue object
             if none found, returns None
         """
+        #Use cached version when available
+        if self.cache:
+            raw = self.cache.get(key)
+            if raw:
+                return self.issue_from_raw(raw)
         try:
             issue = self.jira.issue(key)
         except JIRAError as e:
             print "Jira Error when searching for:",key,e
             issue = None
+        else:
+            if self.cache:
+                self.cache.put([issue.raw])
         return issue
 
     def issue_comments(self,issue,get_now=True):
@@ -384,72 +1732,244 @@ class JiraComm:
         #NB issue sometimes lacks fields.comment attribute even when actually
         #present in Jira. Seems to be problem with jira.search_issue
         #Can get from individual issue using JIRA.jira.issue() when absent from main search
+        temp_issue = None
         if get_now:
-            if not self.jira:
+            #Use cached comments when available
+            raw = self.cache.get(issue.key, "comment") if self.cache else None
+            if raw:
+                temp_issue = self.issue_from_raw(raw)
+            elif not self.jira:
                 print "Can't get comments because not connected to Jira."
             else:
                 #Retrieve comment now
                 temp_issue = self.jira.issue(issue.key, fields='comment')
+                if self.cache:
+                    self.cache.put([temp_issue.raw], "comment")
         #If  get_now false, use supplied issue
         else:
             temp_issue = issue
 
         if temp_issue:
-            #Extract details from comment and store in dictionary for convenient access
-            #Some issues might not have issue.fields.comment attribute as
-            #might be absent if no comment has recorded
-            if "comment" in temp_issue.fields.__dict__.keys():
-                for comment in temp_issue.fields.comment.comments:
-                    temp_dict = {}
-                    temp_dict["Author"] = comment.author.displayName
-                    temp_dict["Body"] = comment.body
-                    temp_dict["Updated"] = self.date_reformat(comment.updated)
-                    comments.append(temp_dict)
+            comments = self.comment_details(temp_issue)
+        return comments
+
+    def comment_details(self, issue):
+        """Extracts details of comments already present in issue
+        Args:
+            issue - Jira issue object
+        Returns:
+            list containing dictionary of details for each comment
+        """
+        comments = []
+        #Extract details from comment and store in dictionary for convenient access
+        #Some issues might not have issue.fields.comment attribute as
+        #might be absent if no comment has recorded
+        if "comment" in issue.fields.__dict__.keys():
+            for comment in issue.fields.comment.comments:
+                temp_dict = {}
+                temp_dict["Author"] = comment.author.displayName
+                temp_dict["Body"] = comment.body
+                temp_dict["Updated"] = self.date_reformat(comment.updated)
+                comments.append(temp_dict)
+        return comments
+
+    def bulk_issue_comments(self, issues, refresh=False, batch_size=100, workers=4):
+        """Gets comments associated with several issues.
+        Comments are taken from the issues themselves when present. Those
+        missing (or all of them if refresh True) are taken from the cache or
+        retrieved from Jira using "key in (...)" searches of up to batch_size
+        issues, several searches at a time. Much quicker than using
+        self.issue_comments(get_now=True) for each issue.
+        Args:
+            issues - list of Jira issue objects
+            refresh (bool) - when True retrieve comments of every issue,
+            otherwise only those lacking fields.comment
+            batch_size - maximum number of issues retrieved by each search
+            workers - maximum number of searches at the same time
+        Returns:
+            dictionary with issue key as key and list of comment details as
+            value (same as returned by self.issue_comments())
+        """
+        comments = {}
+
+        #Find issues without comments
+        missing = []
+        for issue in issues:
+            if refresh or "comment" not in issue.fields.__dict__.keys():
+                missing.append(issue.key)
+            else:
+                comments[issue.key] = self.comment_details(issue)
+
+        #Use cached comments when available
+        if self.cache:
+            to_get = []
+            for key in missing:
+                raw = self.cache.get(key, "comment")
+                if raw:
+                    comments[key] = self.comment_details(self.issue_from_raw(raw))
+                else:
+                    to_get.append(key)
+            missing = to_get
+
+        if missing and not self.jira:
+            print "Can't get comments because not connected to Jira."
+        elif missing:
+            for page in self.search_keys(missing, "comment", batch_size=batch_size, workers=workers):
+                for issue in page:
+                    comments[issue.key] = self.comment_details(issue)
+                if self.cache:
+                    self.cache.put([issue.raw for issue in page], "comment")
         return comments
 
     def issue_details(self, issue):
         """Extract details associated with Jira issue object and return as
-        dictionary.
+        ResultRow (used like dictionary).
         If an item is mapped to a function in self.reprocess_mapping, the
         selected value will be automatically transformed by the chosen
         function.
         Args:
             issue - Jira issue object
         Returns:
-            dictionary containing details
+            ResultRow containing details
         """
-        #Extract details from the issue and store in dictionary, "details"
-        #Mapping taken from self.field_mapping
-        #Multi-value items may require extra processing.
-        details = {}
-        for item in self.field_mapping:
-            value =  multi_getattr(issue,item[2])
-            ##print "v:",value,"i:",item
+        return self.extract_details([issue])[0]
 
-            #Reprocess the value if we have a reprocess mapping defined
-            #and a value to work with
-            if item[0] in self.reprocess_mapping and value:
-                #Retrieve the corresponding function
-                fn_key = self.reprocess_mapping[item[0]]
-                fn = self.reprocess[fn_key]
-                #Apply the function to the value
-                value = fn(value)
-
-            #Store the value
-            details[item[0]] = value
-
-        return details
+    def extract_details(self, issues, raw=False):
+        """Extracts details from list of issues, including column transforms.
+        Args:
+            issues - list of Jira issue objects (or raw issue details if raw True)
+            raw (bool) - issues are raw issue details
+        Returns:
+            list of results (ResultRow objects containing details)
+        """
+        #Extract details from each issue and store in ResultRow
+        #Functions created from self.field_mapping by self.compile_field_mapping()
+        #Multi-value items may require extra processing (included in functions).
+        accessors = [accessor for heading, accessor in (self.raw_accessors if raw else self.accessors)]
+        row_type = self.row_type
+        results = [row_type([accessor(issue) for accessor in accessors]) for issue in issues]
+        return self.intern_values(self.transform_columns(results))
+
+    def intern_values(self, results):
+        """Makes results share a single copy of each repeated text value (such
+        as status or assignee) rather than each having its own, using
+        self.symbols. Values of self.unique_fields left alone.
+        Args:
+            results - list of ResultRow objects, updated in place
+        Returns:
+            results
+        """
+        symbols = self.symbols
+        for position in self.intern_positions:
+            for result in results:
+                value = result.data[position]
+                if value.__class__ is unicode or value.__class__ is str:
+                    result.data[position] = symbols.setdefault(value, value)
+        return results
+
+    def transform_columns(self, results):
+        """Applies column transforms (self.column_transforms) to results
+        Args:
+            results - list of results (dictionaries of issue details), updated in place
+        Returns:
+            results
+        """
+        for heading, fn in self.column_transforms:
+            rows = [result for result in results if heading in result]
+            if rows:
+                for result, value in itertools.izip(rows, fn([result[heading] for result in rows])):
+                    result[heading] = value
+        return results
+
+    def results_store(self):
+        """Returns ResultStore holding self.extracted_results, for quick
+        selecting, grouping and counting of results. Created when first
+        needed and re-created if self.extracted_results replaced or its
+        length changes (but not if individual results changed).
+        """
+        if (self.store is None or self.store_source is not self.extracted_results
+                or len(self.store) != len(self.extracted_results)):
+            self.store = ResultStore([e[0] for e in self.field_mapping], self.extracted_results)
+            self.store_source = self.extracted_results
+        return self.store
+
+    def raw_issue_details(self, raw):
+        """Same as self.issue_details() but for raw issue details (as returned
+        by search with json_result=True) rather than Jira issue object.
+        Args:
+            raw - dictionary of raw issue details
+        Returns:
+            ResultRow containing details
+        """
+        return self.extract_details([raw], raw=True)[0]
 
-    def extract_info(self):
+    def extract_info(self, processes=1, chunk_size=1000):
         """Extracts details of each retrieved issue and stores in list of
-        dictionaries for more convenient handling."""
+        ResultRow objects (used like dictionaries) for more convenient handling.
+        Args:
+            processes - number of processes used (see self.extract_raws())
+            chunk_size - number of issues handled by a process at a time
+        """
         self.extracted_results = []
-        for issue in self.issues:
-            details = self.issue_details(issue)
-            self.extracted_results.append(details)
+        with self.stats.timer("Extract details"):
+            if processes > 1:
+                self.extracted_results = self.extract_raws([issue.raw for issue in self.issues],
+                                                           processes, chunk_size)
+            else:
+                self.extracted_results = self.extract_details(self.issues)
+        self.stats.count("Issues extracted", len(self.issues))
+
+    def extract_raws(self, raws, processes=1, chunk_size=1000):
+        """Extracts details from list of raw issue details, optionally
+        splitting the work between several processes. Only worth using
+        several processes for large numbers of issues (tens of thousands).
+        Reprocess functions used must have been added by register_reprocess_fn().
+        Args:
+            raws - list of raw issue details
+            processes - number of processes used. When 1 details extracted
+                in this process
+            chunk_size - number of issues sent to a process at a time
+        Returns:
+            list of results (ResultRow objects) in same order as raws
+        """
+        if processes <= 1 or len(raws) <= chunk_size:
+            return self.extract_details(raws, raw=True)
 
-    def report(self, results="", headings="", tab="Results", title="", left_col=1, top_row=1, column_widths=""):
-        """Writes details of Jira issues to spreadsheet
+        #Reprocess functions passed to processes by name (column transforms done here)
+        mapping = []
+        for item in self.field_mapping:
+            name = self.reprocess_mapping.get(item[0])
+            if name in self.column_reprocess:
+                name = None
+            if name and self.reprocess[name] is not REPROCESS_FNS.get(name):
+                raise ValueError("Reprocess function '%s' needs to be added using register_reprocess_fn()" % name)
+            mapping.append((item[0], item[2], name))
+
+        #Processes started by copying this one (not on Windows) already have
+        #raws so only need to be told which part to use
+        global WORKER_RAWS
+        forked = sys.platform != "win32"
+        if forked:
+            WORKER_RAWS = raws
+            chunks = [(start, start+chunk_size) for start in xrange(0, len(raws), chunk_size)]
+        else:
+            chunks = [raws[start:start+chunk_size] for start in xrange(0, len(raws), chunk_size)]
+
+        results = []
+        pool = multiprocessing.Pool(processes, init_extract_worker, (mapping,))
+        try:
+            row_type = self.row_type
+            for chunk in pool.imap(extract_raw_chunk, chunks):
+                results.extend([row_type(list(values)) for values in chunk])
+        finally:
+            pool.terminate()
+            pool.join()
+            WORKER_RAWS = []
+        return self.intern_values(self.transform_columns(results))
+
+    def report(self, results="", headings="", tab="Results", title="", left_col=1, top_row=1, column_widths="",
+                exporter=None):
+        """Writes details of Jira issues to spreadsheet (or other exporter)
 
         Args:
             results: list of Jira results objects to write to spreadsheet.
@@ -463,49 +1983,230 @@ class JiraComm:
             top_row - topmost row to write from
             column_widths - optional columns width values for spreadsheet. Either
                 as dictionary {"A":15,"B":9,"C":15} or list [1,2,3]
+            exporter - exporter used to write report (ExcelSheet, CsvExporter
+                or ParquetExporter). Defaults to self.exporter
         """
-        #Create tab if it's not already present
-        if tab not in self.excel.wb.sheetnames:
-            self.excel.add_tab(tab)
-
         #Get column number from letter (not currently used)
         ##column = openpyxl.cell.column_index_from_string(col_letter)
 
-        #Default set of results to all of them
-        if not results:
+        #Default set of results to all of them (empty list gives empty report)
+        if isinstance(results, basestring):
             results = self.extracted_results
 
         #Default headings
         if not headings:
             headings = [e[0] for e in self.field_mapping]
 
-        #Add title
-        title = title+" "+self.latest_proj_code+" - "+self.latest_proj_name+ " Count:"+str(len(results))+ " ["+self.latest_runtime+"]"
-        self.excel.cell_set(ws_id=tab, row=top_row, column=left_col, value=title, bold=True)
-
-        #Add headings
-        self.excel.table_headings(tab=tab, row=top_row+1, column=left_col, headings=headings)
-
-        #Add row data to all results tab for each issue
-        for r, result in enumerate(results):
-            #Iterating over headings to preserver column order
-            for k, key in enumerate(headings):
-                ##print details[key]
-                #In case key is invalid, check it's present
-                if key in result:
-                    value = result[key]
-                else:
-                    value = ""
-                    print key,"not found in results."
-                #Change None or [] to empty string
-                if type(value) in (None, list):
-                    value = ""
-                #Write issue to spreadsheet
-                self.excel.cell_set(ws_id=tab, row=2+top_row+r,
-                            column=left_col+k, value=value, border=True)
-        #Adjust column widths if supplied
-        if column_widths:
-            self.excel.update_col_widths(tab=tab, widths=column_widths)
+        #Get details left out of the main search (see self.get_project_issues())
+        lazy = [heading for heading in headings if heading in self.lazy_headings]
+        if lazy:
+            self.fill_lazy(results, lazy)
+
+        #Add title, headings and row data for each issue
+        exporter = exporter or self.exporter
+        rows = (self.result_row(result, headings) for result in results)
+        with self.stats.timer("Write report rows"):
+            count = exporter.write_table(tab, self.report_title(title, len(results)), headings, rows,
+                                         left_col=left_col, top_row=top_row, column_widths=column_widths)
+        self.stats.count("Rows written", count)
+        self.stats.count("Cells written", count*len(headings))
+
+    def highlight(self, tab, rules, results="", headings="", left_col=1, top_row=1, fi=28):
+        """Highlights cells of report already written by self.report() using
+        Excel conditional formatting (see ExcelSheet.highlight_rules())
+        Args:
+            tab - tab report written to
+            rules - list of (heading, condition, value) tuples, e.g.
+                [("Status", "in", ["Failed", "New Bug"]), ("Date Updated", "older than", 30)]
+                Conditions as for ExcelSheet.highlight_rules()
+            results, headings, left_col, top_row - as used for self.report()
+            fi - index number of highlight colour from ExcelSheet.fill_colours
+        Returns:
+            list of number of results matching each rule (found using ResultStore
+            rather than the spreadsheet)
+        """
+        #Default set of results to all of them (empty list gives empty report)
+        if isinstance(results, basestring):
+            store = self.results_store()
+        else:
+            store = ResultStore([e[0] for e in self.field_mapping], results)
+
+        #Default headings
+        if not headings:
+            headings = [e[0] for e in self.field_mapping]
+
+        counts = []
+        for heading, condition, value in rules:
+            #Report rows start two rows below title
+            letter = openpyxl.utils.get_column_letter(left_col + headings.index(heading))
+            cell_range = "%s%i:%s%i" % (letter, top_row+2, letter, top_row+1+max(len(store), 1))
+            self.excel.highlight_rules(tab, cell_range, [(condition, value)], fi=fi)
+            counts.append(self.rule_count(store, heading, condition, value))
+        return counts
+
+    def rule_count(self, store, heading, condition, value):
+        """Returns number of results in ResultStore matching highlight rule
+        (see self.highlight()). Only distinct values of heading are checked.
+        Text compared ignoring case, as Excel does."""
+        def fold(value):
+            return value.lower() if isinstance(value, basestring) else value
+
+        index = store.index(heading)
+        if condition in ("equals", "in"):
+            wanted = set([fold(item) for item in ([value] if condition == "equals" else value)])
+            matches = [key for key in index if fold(key) in wanted]
+        elif condition == "contains":
+            text = value.lower()
+            matches = [key for key in index if isinstance(key, basestring) and text in key.lower()]
+        elif condition == "older than":
+            cutoff = datetime.datetime.combine(datetime.date.today(), datetime.time()) - datetime.timedelta(days=value)
+            matches = [key for key in index if isinstance(key, datetime.datetime) and key < cutoff]
+        else:
+            raise ValueError("Unknown highlight condition: %s" % condition)
+        return sum([len(index.get(match, [])) for match in set(matches)])
+
+    def report_title(self, title, count):
+        """Returns report title with project code, name, count and run time added
+        Args:
+            title - title text
+            count - number of results in report
+        """
+        title = title+" "+self.latest_proj_code+" - "+self.latest_proj_name+ " Count:"+str(count)+ " ["+self.latest_runtime+"]"
+        if not self.latest_complete:
+            title = title + " INCOMPLETE"
+        return title
+
+    def stream_report(self, project, tab="Results", title="", headings="", left_col=1, top_row=1,
+                        column_widths="", fields=None, max_results=1000, raw=True, keep=False, exporter=None,
+                        paging="offset"):
+        """Retrieves all issues associated with project and writes them to
+        spreadsheet as each page of results arrives, without holding them all
+        in memory. With write-only spreadsheet (see ExcelSheet) memory use is
+        limited to about one page of results.
+
+        Args:
+            project - project code, e.g. "K008"
+            tab, title, headings, left_col, top_row, column_widths, exporter - as for self.report()
+            fields, max_results, raw, paging - as for self.get_project_issues()
+            keep (bool) - when True also store results in self.extracted_results
+                (and Jira issue objects in self.issues when raw is False)
+        Returns:
+            number of issues written
+        """
+        #Default fields
+        if not fields:
+            fields = ",".join([e[1] for e in self.field_mapping])
+
+        #Default headings
+        if not headings:
+            headings = [e[0] for e in self.field_mapping]
+
+        if keep:
+            self.issues = []
+            self.extracted_results = []
+
+        #Set the runtime, project and project code
+        self.latest_runtime =  time.strftime("%d/%m/%Y (%H:%M:%S)")
+        self.latest_proj_code = project
+        self.latest_proj_name = self.project_name(project) or ""
+
+        if not self.latest_proj_name:
+            print "User has no access to project:",project
+            return 0
+
+        search_string = "project="+project
+        print "***",search_string,"***"
+        self.incomplete.discard(search_string)
+        self.latest_complete = True
+
+        #First page needed before writing anything as it gives total for title
+        if paging == "keyset":
+            pages = self.iter_pages_keyset(search_string, fields, max_results, raw)
+        else:
+            pages = self.iter_pages(search_string, fields, max_results, raw)
+        first_page = next(pages)
+        total = getattr(first_page, "total", len(first_page))
+
+        #Chain of generators: pages -> extracted details (a page at a time,
+        #so column transforms see the whole page) -> spreadsheet rows
+        def results():
+            for page in itertools.chain([first_page], pages):
+                if keep and not raw:
+                    self.issues.extend(page)
+                details = self.extract_details(page, raw)
+                if keep:
+                    self.extracted_results.extend(details)
+                for result in details:
+                    yield result
+
+        exporter = exporter or self.exporter
+        rows = (self.result_row(result, headings) for result in results())
+        with self.stats.timer("Stream report"):
+            count = exporter.write_table(tab, self.report_title(title, total), headings, rows,
+                                         left_col=left_col, top_row=top_row, column_widths=column_widths)
+        self.stats.count("Rows written", count)
+        self.stats.count("Cells written", count*len(headings))
+        print "Finished writing issues. Found:",count
+        if search_string in self.incomplete:
+            print "WARNING: Not all issues retrieved for project:",project
+            self.latest_complete = False
+        self.complete[project] = self.latest_complete
+        return count
+
+    def result_row(self, result, headings):
+        """Returns list of values from result for writing to spreadsheet row
+        Args:
+            result - ResultRow or dictionary of issue details (from self.extracted_results)
+            headings - list of column headings to include, in desired order.
+        """
+        row = []
+        #ResultRow values read directly from its list using heading positions (quicker)
+        data = None
+        if isinstance(result, ResultRow):
+            data, result = result.data, result.positions
+        #Iterating over headings to preserver column order
+        for key in headings:
+            #In case key is invalid, check it's present
+            if key in result:
+                value = result[key] if data is None else data[result[key]]
+            else:
+                value = ""
+                print key,"not found in results."
+            #Change None or [] to empty string
+            if type(value) in (None, list):
+                value = ""
+            row.append(value)
+        return row
+
+    def write_run_stats(self, tab="Run Stats"):
+        """Writes timings and counts collected in self.stats to tab placed
+        after "Info" tab (does nothing if stats not enabled).
+        Call before saving spreadsheet (so time taken by save not included).
+        Args:
+            tab - tab name
+        """
+        if not self.stats.enabled:
+            return
+        if tab not in self.excel.wb.sheetnames:
+            self.excel.add_tab(tab, index=1)
+        self.excel.cell_set(ws_id=tab, row=1, column=1, value="Run Stats ["+time.strftime("%d/%m/%Y (%H:%M:%S)")+"]", bold=True)
+        self.excel.table_headings(tab=tab, row=2, column=1, headings=["Item", "Value"])
+        self.excel.table_values(tab=tab, row=3, column=1, data=self.stats.summary())
+        self.excel.update_col_widths(tab=tab, widths={"A":32, "B":16})
+
+    def save_run_stats(self, filename=""):
+        """Saves timings and counts collected in self.stats as JSON
+        (does nothing if stats not enabled).
+        Args:
+            filename - optional filename. Defaults to Excel filename but
+            ending .json
+        """
+        if not self.stats.enabled:
+            return
+        if not filename:
+            filename = os.path.splitext(self.excel_file)[0] + ".json"
+        with open(filename, "w") as f:
+            f.write(self.stats.as_json())
 
     def date_reformat(self,jdate):
         """Dates from Jira are strings such as '2016-03-11T15:32:28.000+0000'
@@ -516,7 +2217,17 @@ class JiraComm:
         returns:
             date in string format but with components re-arraged.
         """
-        return jdate[8:10]+"/"+jdate[5:7]+"/"+jdate[:4]+" "+jdate[11:19]
+        return date_fix(jdate)
+
+    def jql_date(self,jdate):
+        """Converts date from Jira, e.g. '2016-03-11T15:32:28.000+0000', into
+        format accepted by JQL, e.g. '2016-03-11 15:32'
+        JQL dates only go to the minute so searches using them may return
+        some issues already seen. Merging by key takes care of these.
+        args:
+            jdate - date in string format from jira
+        """
+        return jdate[:10]+" "+jdate[11:16]
 
     def issue_field_exam(self,issue):
         """Lists fields associated with a Jira object
@@ -557,29 +2268,448 @@ class JiraComm:
             print "Severity (custom):",i.fields.customfield_10405.value
 
 
+class AsyncJiraComm(JiraComm):
+    """
+    JiraComm with additional non-blocking methods, for running several
+    reports or requests from one process. Each method starts the request on
+    a shared pool of threads and immediately returns an AsyncResult object.
+    Call its get() method to wait for and return the result (or use
+    self.gather() to wait for several).
+    Non-blocking methods don't change self.issues, self.extracted_results or
+    details of the latest run, so can be used at the same time.
+
+    args:
+        as for JiraComm, plus
+        pool_workers - number of requests that can run at the same time
+    """
+    def __init__(self, *args, **kwargs):
+        pool_workers = kwargs.pop("pool_workers", 8)
+        JiraComm.__init__(self, *args, **kwargs)
+        self.pool = ThreadPool(pool_workers)
+
+    def get_project_issues_async(self, project, callback=None, **kwargs):
+        """Retrieves all issues associated with project and extracts their details.
+        Args:
+            project - project code, e.g. "K008"
+            callback - optional function called with result when ready
+            Other keyword arguments (fields, max_results, workers, incremental, raw)
+            are passed to self.retrieve_project_issues()
+        Returns:
+            AsyncResult. Result is dictionary with keys "project", "runtime",
+            "issues" and "extracted_results" ("issues" empty when raw True)
+        """
+        def fetch():
+            run = {"project":project, "runtime":time.strftime("%d/%m/%Y (%H:%M:%S)")}
+            issues = self.retrieve_project_issues(project, **kwargs)
+            run["extracted_results"] = self.extract_details(issues, kwargs.get("raw"))
+            run["issues"] = [] if kwargs.get("raw") else issues
+            return run
+        return self.pool.apply_async(fetch, callback=callback)
+
+    def get_issue_async(self, key, callback=None):
+        """Gets single issue from Jira (see self.get_issue()).
+        Returns:
+            AsyncResult. Result is issue object (or None if not found)
+        """
+        return self.pool.apply_async(self.get_issue, (key,), callback=callback)
+
+    def bulk_issue_comments_async(self, issues, callback=None, **kwargs):
+        """Gets comments associated with several issues (see self.bulk_issue_comments())
+        Returns:
+            AsyncResult. Result is dictionary of comments by issue key.
+        """
+        return self.pool.apply_async(self.bulk_issue_comments, (issues,), kwargs, callback=callback)
+
+    def gather(self, async_results, timeout=None):
+        """Waits for several AsyncResult objects
+        Args:
+            async_results - list of AsyncResult objects
+            timeout - optional maximum seconds to wait for each
+        Returns:
+            list of results, in same order
+        """
+        return [async_result.get(timeout) for async_result in async_results]
+
+    def close(self):
+        """Stops the pool of threads once all requests finished"""
+        self.pool.close()
+        self.pool.join()
+
+
+class RunStats:
+    """
+    Collects timings and counts for stages of a run, bytes received from
+    Jira and peak memory use. When not enabled all methods do (almost)
+    nothing, so can be left in place.
+
+    args:
+        enabled (bool) - collect stats when True
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.time()
+        #{name:[number of times, total seconds]}
+        self.timings = {}
+        #{name:count}
+        self.counters = {}
+        #Stats can be collected by several threads at once
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timing(self, name):
+        """Context manager which adds time taken by the code it contains (see self.timer())"""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time()-started)
+
+    def timer(self, name):
+        """Returns context manager which times the code it contains, e.g.
+            with stats.timer("Save"):
+                wb.save(filename)
+        Args:
+            name - name of the stage being timed
+        """
+        if self.enabled:
+            return self.timing(name)
+        return NO_TIMER
+
+    def add_time(self, name, seconds):
+        """Adds time taken by a stage
+        Args:
+            name - name of the stage
+            seconds - time taken
+        """
+        if self.enabled:
+            with self.lock:
+                timing = self.timings.setdefault(name, [0, 0.0])
+                timing[0] += 1
+                timing[1] += seconds
+
+    def count(self, name, amount=1):
+        """Increases a counter
+        Args:
+            name - name of counter
+            amount - amount to increase by
+        """
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def response_hook(self, response, *args, **kwargs):
+        """Counts bytes received. For use as requests session response hook."""
+        self.count("Bytes received", len(response.content))
+
+    def peak_memory_mb(self):
+        """Returns peak memory use of process in MB (or None if unknown)"""
+        if not resource:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #Linux gives kilobytes, Mac bytes
+        if os.uname()[0] == "Darwin":
+            peak = peak / 1024
+        return round(peak / 1024.0, 1)
+
+    def summary(self):
+        """Returns stats as list of [item, value] pairs"""
+        rows = [["Total seconds", round(time.time()-self.started, 3)]]
+        for name in sorted(self.timings):
+            rows.append([name+" (seconds)", round(self.timings[name][1], 3)])
+            rows.append([name+" (times)", self.timings[name][0]])
+        for name in sorted(self.counters):
+            rows.append([name, self.counters[name]])
+        rows.append(["Peak memory (MB)", self.peak_memory_mb()])
+        return rows
+
+    def as_json(self):
+        """Returns stats as JSON string"""
+        return json.dumps({"total_seconds":time.time()-self.started,
+                           "timings":dict((name, {"times":t[0], "seconds":t[1]}) for name, t in self.timings.items()),
+                           "counters":self.counters,
+                           "peak_memory_mb":self.peak_memory_mb()}, indent=2, sort_keys=True)
+
+
+class NoTimer:
+    """Context manager which does nothing. Used by RunStats when not enabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NO_TIMER = NoTimer()
+
+
+class ResultStore:
+    """
+    Holds results (dictionaries of issue details, as in
+    JiraComm.extracted_results) column-wise: one list of values per heading.
+    Results are identified by their position. Indexes of positions by value
+    are built for a heading when first needed, so selecting, grouping and
+    counting by a heading only scan the results once however many values
+    or groups there are.
+
+    args:
+        headings - list of headings (keys of results) to hold
+        results - optional list of results to add
+    """
+    def __init__(self, headings, results=()):
+        self.headings = list(headings)
+        self.row_type = result_row_type(self.headings)
+        self.columns = dict((heading, []) for heading in self.headings)
+        #Indexes built so far {heading:{value:[positions]}}
+        self.indexes = {}
+        self.length = 0
+        self.extend(results)
+
+    def __len__(self):
+        return self.length
+
+    def key(self, value):
+        """Returns value in form usable as index key (lists can't be used)"""
+        if isinstance(value, list):
+            return tuple(value)
+        return value
+
+    def append(self, result):
+        """Adds a result (dictionary of issue details)"""
+        for heading in self.headings:
+            value = result.get(heading)
+            self.columns[heading].append(value)
+            #Keep existing indexes up to date
+            if heading in self.indexes:
+                self.indexes[heading].setdefault(self.key(value), []).append(self.length)
+        self.length += 1
+
+    def extend(self, results):
+        """Adds each of a list of results"""
+        for result in results:
+            self.append(result)
+
+    def row(self, position):
+        """Returns result at position as ResultRow"""
+        return self.row_type([self.columns[heading][position] for heading in self.headings])
+
+    def rows(self, positions=None):
+        """Returns list of results (as ResultRow objects) at positions, or all results if
+        positions not given"""
+        if positions is None:
+            positions = xrange(self.length)
+        return [self.row(position) for position in positions]
+
+    def index(self, heading):
+        """Returns index of heading's values {value:[positions]}. Built when first needed."""
+        if heading not in self.indexes:
+            index = {}
+            for position, value in enumerate(self.columns[heading]):
+                index.setdefault(self.key(value), []).append(position)
+            self.indexes[heading] = index
+        return self.indexes[heading]
+
+    def select(self, heading, values, positions=None):
+        """Returns positions (in order) of results where value of heading is one of values
+        Args:
+            heading - heading to check, e.g. "Status"
+            values - list of values wanted, e.g. ["New Bug", "In Test"]
+            positions - optional positions to select from (default is all results)
+        """
+        index = self.index(heading)
+        selected = []
+        for value in set([self.key(value) for value in values]):
+            selected.extend(index.get(value, []))
+        if positions is not None:
+            wanted = set(positions)
+            selected = [position for position in selected if position in wanted]
+        selected.sort()
+        return selected
+
+    def group_by(self, heading, positions=None):
+        """Returns positions of results grouped by value of heading {value:[positions]}
+        Args:
+            heading - heading to group by, e.g. "Components"
+            positions - optional positions to group (default is all results)
+        """
+        if positions is None:
+            return dict((value, list(group)) for value, group in self.index(heading).iteritems())
+        column = self.columns[heading]
+        groups = {}
+        for position in positions:
+            groups.setdefault(self.key(column[position]), []).append(position)
+        return groups
+
+    def count_by(self, heading, positions=None):
+        """Returns number of results with each value of heading {value:count}
+        Args as for self.group_by()
+        """
+        return dict((value, len(group)) for value, group in self.group_by(heading, positions).iteritems())
+
+
+class IssueCache:
+    """
+    On-disk cache of raw Jira issue details (as held in issue.raw), stored
+    in SQLite database. Each issue held by key together with its updated
+    value, the fields it includes and the time it was stored. Also holds
+    keys found by each search so that repeated searches can be answered
+    from the cache.
+
+    args:
+        filename - SQLite database filename (created if not already present)
+        ttl - seconds for which cached details are used. Older details are
+            treated as absent.
+        max_issues - maximum number of issues held. Least recently stored
+            issues removed when exceeded.
+    """
+    def __init__(self, filename, ttl=3600, max_issues=100000):
+        self.ttl = ttl
+        self.max_issues = max_issues
+        #Connection shared by threads so needs a lock
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS issues (key TEXT PRIMARY KEY, updated TEXT, fields TEXT, raw TEXT, stored REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS issues_stored ON issues (stored)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS searches (search TEXT, fields TEXT, keys TEXT, stored REAL, PRIMARY KEY (search, fields))")
+        self.db.commit()
+
+    def covers(self, stored_fields, fields):
+        """Returns True if cached fields include all required fields
+        Args:
+            stored_fields - comma separated fields held in cache ("*all" for every field)
+            fields - comma separated fields required ("*all" for every field)
+        """
+        if stored_fields == "*all":
+            return True
+        return set(fields.split(",")) <= set(stored_fields.split(","))
+
+    def get(self, key, fields="*all"):
+        """Gets cached details of an issue
+        Args:
+            key - issue key, e.g. "K008-17"
+            fields - comma separated fields required. Default is every field
+        Returns:
+            dictionary of raw issue details or None if not cached, too old or
+            lacking required fields
+        """
+        with self.lock:
+            row = self.db.execute("SELECT fields, raw, stored FROM issues WHERE key=?", (key,)).fetchone()
+        if row and time.time() - row[2] <= self.ttl and self.covers(row[0], fields):
+            return json.loads(row[1])
+        return None
+
+    def put(self, raws, fields="*all"):
+        """Stores raw details of issues.
+        Where issue already cached with same updated value, or new details
+        lack an updated value, fields are merged with cached ones.
+        Args:
+            raws - list of dictionaries of raw issue details
+            fields - comma separated fields held in raws ("*all" for every field)
+        """
+        now = time.time()
+        with self.lock:
+            for raw in raws:
+                updated = raw.get("fields", {}).get("updated") or ""
+                stored_fields = fields
+                row = self.db.execute("SELECT updated, fields, raw FROM issues WHERE key=?", (raw["key"],)).fetchone()
+                if row and (not updated or updated == row[0]) and fields != "*all":
+                    old_raw = json.loads(row[2])
+                    old_raw["fields"].update(raw.get("fields", {}))
+                    raw = old_raw
+                    updated = row[0]
+                    if row[1] == "*all":
+                        stored_fields = "*all"
+                    else:
+                        stored_fields = ",".join(sorted(set(row[1].split(",")) | set(fields.split(","))))
+                self.db.execute("INSERT OR REPLACE INTO issues VALUES (?,?,?,?,?)",
+                                (raw["key"], updated, stored_fields, json.dumps(raw), now))
+            self.db.commit()
+        self.evict()
+
+    def get_search(self, search, fields):
+        """Gets cached results of a search
+        Args:
+            search - JQL search string
+            fields - comma separated fields included in search
+        Returns:
+            list of raw issue details in search order, or None if search not
+            cached, too old or any of its issues no longer cached
+        """
+        with self.lock:
+            row = self.db.execute("SELECT keys, stored FROM searches WHERE search=? AND fields=?", (search, fields)).fetchone()
+        if not row or time.time() - row[1] > self.ttl:
+            return None
+        raws = []
+        for key in json.loads(row[0]):
+            raw = self.get(key, fields)
+            if raw is None:
+                return None
+            raws.append(raw)
+        return raws
+
+    def put_search(self, search, fields, raws):
+        """Stores results of a search (and the issues found)
+        Args:
+            search - JQL search string
+            fields - comma separated fields included in search
+            raws - list of raw issue details in search order
+        """
+        self.put(raws, fields)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO searches VALUES (?,?,?,?)",
+                            (search, fields, json.dumps([raw["key"] for raw in raws]), time.time()))
+            self.db.commit()
+
+    def evict(self):
+        """Removes least recently stored issues when more than self.max_issues held"""
+        with self.lock:
+            count = self.db.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+            if count > self.max_issues:
+                self.db.execute("DELETE FROM issues WHERE key IN (SELECT key FROM issues ORDER BY stored LIMIT ?)",
+                                (count - self.max_issues,))
+                self.db.commit()
+
+
 class ExcelSheet:
-    def __init__(self,filename = "", newfile = True, tabrename = ""):
+    def __init__(self,filename = "", newfile = True, tabrename = "", write_only=False):
         """
         Helps create and update Excel spreadsheet (uses openpyxl)
         Args:
             filename (str) - spreadsheet filename (can be full path)
             newfile (bool) - create new filename if True, otherwise load existing
             tabrename (str) - Optional new name for active tab. This is only tab in a new spreadsheet
+            write_only (bool) - when True (and newfile True) use openpyxl write-only
+                mode. Uses much less memory and saves faster with large
+                spreadsheets but the rows of each tab have to be written
+                from top to bottom and can't be changed (or read) once written.
+                See self.flush(). Column widths must be set before first row written.
         """
         #Create/Open spreadsheet
         self.filename = filename
+        self.write_only = write_only and newfile
+
+        #Timings and counts, replaced by JiraComm when collecting stats (see RunStats)
+        self.stats = RunStats()
+
+        #Cells of write-only tabs waiting for their row to be written {tab:{row:{column:cell}}}
+        self.pending = {}
+        #Number of next row to be written to each write-only tab
+        self.next_row = {}
+
         if newfile:
             #Create a new spreadsheet
-            self.wb = openpyxl.Workbook()
+            self.wb = openpyxl.Workbook(write_only=self.write_only)
         else:
             #Load existing spreadsheet
             self.wb = openpyxl.load_workbook(filename=filename)
 
         #Rename the active tab if tabrename set (mainly of value for new spreadsheets to set name of their initial tab)
         if tabrename:
-            ws = self.wb.active
-            ws.sheet_view.showGridLines = False
-            ws.title = tabrename
+            if self.write_only:
+                #Write-only spreadsheet starts without any tabs
+                self.add_tab(tabrename)
+            else:
+                ws = self.wb.active
+                ws.sheet_view.showGridLines = False
+                ws.title = tabrename
 
         #Define some standard formatting settings
 
@@ -600,6 +2730,90 @@ class ExcelSheet:
              top=openpyxl.styles.Side(style='thin'),
              bottom=openpyxl.styles.Side(style='thin'))
 
+        #Fonts already created, shared between cells (see self.get_font())
+        self.fonts = {}
+        #Styles already created, copied to cells (see self.get_style())
+        self.styles = {}
+        #Excel number format of dates written by self.table_rows()
+        self.date_format = "dd/mm/yyyy hh:mm:ss"
+
+    def get_font(self, bold=False, colour="FF000000"):
+        """Returns font with chosen settings. Only one font object is created
+        for each combination of settings.
+        Args:
+            bold - when True make bold
+            colour - text colour as string of four 2-digit hex numbers, alpha,red,green,blue (e.g. "FF1122A0")
+        """
+        key = (bold, colour)
+        if key not in self.fonts:
+            self.fonts[key] = openpyxl.styles.Font(bold=bold, color=colour)
+        return self.fonts[key]
+
+    def get_style(self, ws, bold=False, border=False, colour="FF000000", fi=None, number_format=None):
+        """Returns cell style with chosen settings. Only created once for each
+        combination of settings, after which can be copied to cells, which is
+        much quicker than setting font, border and fill of each cell.
+        Args:
+            ws - worksheet style will be used with
+            bold, border, colour, fi - as for self.cell_set()
+            number_format - optional Excel number format, e.g. "dd/mm/yyyy"
+        Returns:
+            style (openpyxl StyleArray)
+        """
+        key = (bold, border, colour, fi, number_format)
+        if key not in self.styles:
+            #Style settings are registered with the workbook when applied to a cell
+            cell = openpyxl.cell.WriteOnlyCell(ws)
+            cell.font = self.get_font(bold=bold, colour=colour)
+            if border:
+                cell.border = self.cell_thin_border
+            if fi:
+                cell.fill = self.fill_colours[fi]
+            if number_format:
+                cell.number_format = number_format
+            self.styles[key] = cell._style
+        return self.styles[key]
+
+    def get_cell(self, ws, row, column):
+        """Returns cell to be updated.
+        For write-only spreadsheets the cell is held until its row is written
+        by self.flush(). Rows already written can't be updated.
+        Args:
+            ws - worksheet
+            row - row number of cell
+            column - column number of cell
+        """
+        if not self.write_only:
+            return ws.cell(row=row, column=column)
+
+        cell = openpyxl.cell.WriteOnlyCell(ws)
+        if row < self.next_row[ws.title]:
+            print "ExcelSheet.get_cell() Row %i of '%s' not updated because already written." % (row, ws.title)
+        else:
+            self.pending[ws.title].setdefault(row, {})[column] = cell
+        return cell
+
+    def flush(self, tab, upto=None):
+        """Writes the held rows of a write-only tab to the spreadsheet.
+        Does nothing for normal spreadsheets.
+        Args:
+            tab - tab name
+            upto - number of last row to write. If not set all held rows written.
+        """
+        if not self.write_only:
+            return
+        ws = self.wb[tab]
+        rows = self.pending[tab]
+        if upto is None:
+            upto = max(rows) if rows else 0
+        for row in range(self.next_row[tab], upto+1):
+            cells = rows.pop(row, {})
+            if cells:
+                ws.append([cells.get(column) for column in range(1, max(cells)+1)])
+            else:
+                ws.append([])
+        self.next_row[tab] = max(self.next_row[tab], upto+1)
+
     def show_colours(self,ws_id,trow,lcolumn):
         """
         Adds all fill colours to grid in sreadsheet to show what they look like
@@ -612,7 +2826,7 @@ class ExcelSheet:
         for fi, fill in enumerate(self.fill_colours):
             row = trow + fi%16
             column = lcolumn + fi/16
-            cell = ws.cell(row=row,column = column)
+            cell = self.get_cell(ws, row, column)
             cell.value = "Colour "+str(fi)
             cell.fill = self.fill_colours[fi]
 
@@ -622,18 +2836,27 @@ class ExcelSheet:
             newfilename (str) - optional new filename for the save file .
             If not set, self.filename will be used.
         """
-        if newfilename:
-            self.wb.save(newfilename)
-        else:
-            self.wb.save(self.filename)
+        with self.stats.timer("Save spreadsheet"):
+            #Write any held rows of write-only tabs
+            for tab in self.pending:
+                self.flush(tab)
+
+            if newfilename:
+                self.wb.save(newfilename)
+            else:
+                self.wb.save(self.filename)
 
-    def add_tab(self,title,last=True):
+    def add_tab(self,title,last=True,index=None):
         """Add tab to spreadsheet
         Args:
             title - tab name
             last (bool) - create in last position when True, otherwise first position
+            index - optional position to create tab in (overrides last)
         """
-        if last:
+        if index is not None:
+            #Create in chosen position
+            ws = self.wb.create_sheet(index=index,title=title)
+        elif last:
             #Create in last position
             ws = self.wb.create_sheet(title=title)
         else:
@@ -642,6 +2865,10 @@ class ExcelSheet:
         #Turn off gridlines
         ws.sheet_view.showGridLines = False
 
+        if self.write_only:
+            self.pending[title] = {}
+            self.next_row[title] = 1
+
     def select_ws(self,id):
         """Select worksheet by either index number or name
         Args: id - either index number  (int) or name (str) of
@@ -681,17 +2908,15 @@ class ExcelSheet:
             fi - index number (0 to 63) of background colour from self.fill_colours
         """
         ws = self.select_ws(ws_id)
-        cell = ws.cell(row = row, column = column)
+        cell = self.get_cell(ws, row, column)
         try:
             cell.value=value
         except Exception as e:
             cell.value="<ERROR WRITING VALUE>"
 
-        #Text colour
-        cell.font = openpyxl.styles.Font(color=colour)
+        #Text colour (and bold if chosen)
+        cell.font = self.get_font(bold=bold, colour=colour)
 
-        if bold:
-            cell.font = openpyxl.styles.Font(bold=True, color=colour)
         if border:
             cell.border = self.cell_thin_border
         if fi:
@@ -732,10 +2957,10 @@ class ExcelSheet:
         """
         ws = self.wb[tab]
         for dc, heading in enumerate(headings):
-            cell = ws.cell(row = row, column = column+dc )
+            cell = self.get_cell(ws, row, column+dc)
             cell.value = heading
             cell.border = self.cell_thin_border
-            cell.font = openpyxl.styles.Font(bold=True)
+            cell.font = self.get_font(bold=True)
             if fill:
                 cell.fill = self.fill_colours[54]
 
@@ -758,10 +2983,173 @@ class ExcelSheet:
         #Write data to tab
         for dr, rowdata in enumerate(data):
             for dc, colvalue in enumerate(rowdata):
-                cell =  ws.cell(row=row+dr, column=column+dc)
+                cell =  self.get_cell(ws, row+dr, column+dc)
                 cell.value = colvalue
                 cell.border = self.cell_thin_border
 
+    def table_rows(self, tab, row, column, data, bold=False, border=False, colour="FF000000", fi=None):
+        """Adds rows of values to spreadsheet, all with same styling.
+        Much quicker than using self.cell_set() for each cell.
+        For write-only spreadsheets, rows appended straight away (see self.append_rows()).
+        Args:
+            tab - tab name
+            row - row number of first row
+            column - column number of leftmost value
+            data - data to be written as list (or other iterable) of rows,
+            each a list of values [row][column], e.g. [["A","B,"C"],[1,2,3]]
+            bold, border, colour, fi - styling, as for self.cell_set()
+        Returns:
+            number of rows written
+        """
+        ws = self.wb[tab]
+        style = self.get_style(ws, bold=bold, border=border, colour=colour, fi=fi)
+        date_style = self.get_style(ws, bold=bold, border=border, colour=colour, fi=fi,
+                                    number_format=self.date_format)
+        if self.write_only:
+            return self.append_rows(ws, row, column, data, style, date_style)
+        count = 0
+        for dr, rowdata in enumerate(data):
+            for dc, value in enumerate(rowdata):
+                cell = self.get_cell(ws, row+dr, column+dc)
+                try:
+                    cell.value = value
+                except Exception as e:
+                    cell.value = "<ERROR WRITING VALUE>"
+                if type(value) is datetime.datetime:
+                    cell._style = copy.copy(date_style)
+                else:
+                    cell._style = copy.copy(style)
+            count += 1
+        return count
+
+    def append_rows(self, ws, row, column, data, style, date_style):
+        """Writes rows of values straight to write-only tab (used by
+        self.table_rows()). Each row's styled cells are built as a list and
+        appended, rather than held until flushed like cells from
+        self.get_cell(). Cells already held for the same row (e.g. from
+        self.cell_set()) are included.
+        Args:
+            ws - write-only worksheet
+            row, column, data - as for self.table_rows()
+            style, date_style - styles (from self.get_style()) for values and dates
+        Returns:
+            number of rows written
+        """
+        tab = ws.title
+        if row < self.next_row[tab]:
+            print "ExcelSheet.table_rows() Rows from %i of '%s' not written because already written." % (row, tab)
+            return 0
+        #Write any rows held above the table
+        self.flush(tab, upto=row-1)
+
+        #Row written as soon as appended, so the same styled cells can be
+        #re-used for every row {(column offset, date):cell}
+        styled = {}
+        def styled_cell(dc, value):
+            is_date = type(value) is datetime.datetime
+            cell = styled.get((dc, is_date))
+            if cell is None:
+                cell = openpyxl.cell.WriteOnlyCell(ws)
+                cell._style = copy.copy(date_style if is_date else style)
+                styled[(dc, is_date)] = cell
+            try:
+                cell.value = value
+            except Exception as e:
+                cell.value = "<ERROR WRITING VALUE>"
+            return cell
+
+        pending = self.pending[tab]
+        padding = [None]*(column-1)
+        count = 0
+        for rowdata in data:
+            cells = padding + [styled_cell(dc, value) for dc, value in enumerate(rowdata)]
+            #Include cells set separately for this row (table cells take priority)
+            held = pending.pop(row+count, None)
+            if held:
+                cells.extend([None]*(max(held)-len(cells)))
+                for held_column, cell in held.iteritems():
+                    if cells[held_column-1] is None:
+                        cells[held_column-1] = cell
+            ws.append(cells)
+            count += 1
+        self.next_row[tab] = row+count
+        return count
+
+    def write_table(self, tab, title, headings, rows, left_col=1, top_row=1, column_widths=""):
+        """Writes table (title, column headings and rows of values) to tab,
+        which is created if not already present. Same arguments as other
+        exporters (see CsvExporter), so used by JiraComm.report().
+        Args:
+            tab - tab name
+            title - title text written above headings
+            headings - list of column headings
+            rows - list (or other iterable) of rows of values
+            left_col - column number of leftmost column
+            top_row - row number of title
+            column_widths - optional column widths (see self.update_col_widths())
+        Returns:
+            number of rows written
+        """
+        #Create tab if it's not already present
+        if tab not in self.wb.sheetnames:
+            self.add_tab(tab)
+
+        #Add title
+        self.cell_set(ws_id=tab, row=top_row, column=left_col, value=title, bold=True)
+
+        #Adjust column widths if supplied (done first as write-only tabs need widths
+        #before any rows written)
+        if column_widths:
+            self.update_col_widths(tab=tab, widths=column_widths)
+
+        #Add headings then rows
+        self.table_headings(tab=tab, row=top_row+1, column=left_col, headings=headings)
+        return self.table_rows(tab=tab, row=top_row+2, column=left_col, data=rows, border=True)
+
+    def highlight_rules(self, tab, cell_range, rules, fi=28):
+        """Highlights cells using Excel conditional formatting, so Excel decides
+        which cells match when spreadsheet opened. Much quicker than
+        self.highlighter() and works with write-only spreadsheets.
+        Args:
+            tab - tab name
+            cell_range - range of cells, e.g. "C3:C100"
+            rules - list of (condition, value) tuples. A cell is highlighted if it
+                matches any of them. Conditions are:
+                "equals" - cell equals value, e.g. ("equals", "Failed")
+                "contains" - cell contains text (any case), e.g. ("contains", "Portal")
+                "in" - cell equals one of list of values, e.g. ("in", ["P1 V. High", "P2 High"])
+                "older than" - cell holds date more than value days ago, e.g. ("older than", 30)
+            fi - index number of highlight colour from self.fill_colours
+        """
+        #Formulas are relative to top left cell of range
+        cell = cell_range.split(":")[0]
+        formulas = [self.rule_formula(cell, condition, value) for condition, value in rules]
+        formula = formulas[0] if len(formulas) == 1 else "OR(" + ",".join(formulas) + ")"
+        colour = self.colours[fi]
+        fill = openpyxl.styles.PatternFill(start_color=colour, end_color=colour, bgColor=colour, fill_type="solid")
+        self.wb[tab].conditional_formatting.add(cell_range, FormulaRule(formula=[formula], fill=fill))
+
+    def rule_formula(self, cell, condition, value):
+        """Returns Excel formula for highlight rule (see self.highlight_rules())
+        Args:
+            cell - reference of cell formula tested on, e.g. "C3"
+            condition, value - as in rules of self.highlight_rules()
+        """
+        def literal(value):
+            if isinstance(value, basestring):
+                return '"' + value.replace('"', '""') + '"'
+            return str(value)
+
+        if condition == "equals":
+            return cell + "=" + literal(value)
+        if condition == "contains":
+            return "ISNUMBER(SEARCH(" + literal(value) + "," + cell + "))"
+        if condition == "in":
+            return "OR(" + ",".join([cell + "=" + literal(item) for item in value]) + ")"
+        if condition == "older than":
+            return "AND(ISNUMBER(" + cell + ")," + cell + "<TODAY()-" + str(value) + ")"
+        raise ValueError("Unknown highlight condition: %s" % condition)
+
     def highlighter(self,ws_id,row_range,col_range,conditions,show_exceptions=False):
         """Highlights spreadsheet cells based on passed conditions
         Args:
@@ -770,6 +3158,7 @@ class ExcelSheet:
             col_range - iterable containing column numbers to be covered
             conditions - list of functions with conditional return values, used to determine whether highlighting applied
             show_exceptions (bool) - when true message for each failed exception printed to console.
+            Not available for write-only spreadsheets as cells can't be read.
 
         Returns:
             list of integers showing number of times each condition satisfied
@@ -800,6 +3189,192 @@ class ExcelSheet:
 
 
 
+class CsvExporter:
+    """
+    Writes reports to CSV files, one per tab, named <file_start>_<tab>.csv.
+    Rows written as they are produced. Has same write_table() and save()
+    methods as ExcelSheet, so can be used by JiraComm.report() instead.
+    Titles, positions and column widths are ignored. Further tables written
+    to the same tab are added to the end of its file (with headings only
+    repeated if different).
+
+    args:
+        folder - folder files written to (created if not present)
+        file_start - start of filenames
+        encoding - text encoding used
+    """
+    def __init__(self, folder="Results", file_start="Results", encoding="utf-8"):
+        self.folder = folder
+        self.file_start = file_start
+        self.encoding = encoding
+        #Open files {tab:(file, csv writer, headings)}
+        self.files = {}
+
+    def filename(self, tab, extension=".csv"):
+        """Returns full path of file for tab"""
+        name = "".join([c if c.isalnum() or c in " -_" else "_" for c in tab])
+        return os.path.join(self.folder, self.file_start+"_"+name+extension)
+
+    def encode(self, value):
+        """Returns value in form csv module can write"""
+        if isinstance(value, unicode):
+            return value.encode(self.encoding)
+        if value is None:
+            return ""
+        return value
+
+    def write_table(self, tab, title, headings, rows, left_col=1, top_row=1, column_widths=""):
+        """Writes column headings and rows of values to file for tab.
+        Args as for ExcelSheet.write_table()
+        Returns:
+            number of rows written
+        """
+        if tab not in self.files:
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+            f = open(self.filename(tab), "wb")
+            self.files[tab] = (f, csv.writer(f), None)
+        f, writer, previous = self.files[tab]
+        if list(headings) != previous:
+            writer.writerow([self.encode(heading) for heading in headings])
+            self.files[tab] = (f, writer, list(headings))
+
+        count = 0
+        encode = self.encode
+        for row in rows:
+            writer.writerow([encode(value) for value in row])
+            count += 1
+        return count
+
+    def save(self):
+        """Closes all files"""
+        for f, writer, headings in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class ParquetExporter(CsvExporter):
+    """
+    Writes reports to Parquet files (columnar format read by most data
+    tools), one per tab, named <file_start>_<tab>.parquet. Needs pyarrow.
+    Rows collected into batches of batch_size, each written as it fills,
+    so memory use limited to about one batch. Column types are taken from
+    the first batch: dates, whole numbers and decimals kept as such,
+    everything else written as text. Further tables written to the same tab
+    are added to the end of its file, and must have the same headings.
+    Otherwise as CsvExporter.
+
+    args:
+        folder, file_start - as for CsvExporter
+        batch_size - number of rows written at a time
+    """
+    def __init__(self, folder="Results", file_start="Results", batch_size=10000):
+        if pyarrow is None:
+            raise ImportError("ParquetExporter needs pyarrow (pip install pyarrow)")
+        CsvExporter.__init__(self, folder, file_start)
+        self.batch_size = batch_size
+        #Open files {tab:(parquet writer, headings, column types)}
+        self.files = {}
+
+    def column_type(self, values):
+        """Returns pyarrow type for column from its first batch of values"""
+        for value in values:
+            if isinstance(value, datetime.datetime):
+                return pyarrow.timestamp("s")
+            if isinstance(value, bool):
+                return pyarrow.bool_()
+            if isinstance(value, (int, long)):
+                return pyarrow.int64()
+            if isinstance(value, float):
+                return pyarrow.float64()
+            if value is not None:
+                break
+        return pyarrow.string()
+
+    def write_batch(self, tab, headings, batch):
+        """Writes batch of rows to file for tab, opening file if needed"""
+        columns = zip(*batch)
+        if tab not in self.files:
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+            types = [self.column_type(column) for column in columns]
+            schema = pyarrow.schema([pyarrow.field(heading, column_type)
+                                     for heading, column_type in zip(headings, types)])
+            writer = pyarrow.parquet.ParquetWriter(self.filename(tab, ".parquet"), schema)
+            self.files[tab] = (writer, list(headings), types)
+        writer, previous, types = self.files[tab]
+        if list(headings) != previous:
+            raise ValueError("Headings of table for tab '%s' differ from those already written" % tab)
+
+        arrays = []
+        for column, column_type in zip(columns, types):
+            if column_type == pyarrow.string():
+                column = [value if value is None or isinstance(value, unicode) else unicode(value)
+                          for value in column]
+            arrays.append(pyarrow.array(column, type=column_type))
+        writer.write_table(pyarrow.Table.from_arrays(arrays, names=list(headings)))
+
+    def write_table(self, tab, title, headings, rows, left_col=1, top_row=1, column_widths=""):
+        """Writes rows of values to file for tab.
+        Args as for ExcelSheet.write_table()
+        Returns:
+            number of rows written
+        """
+        count = 0
+        rows = iter(rows)
+        for batch in iter(lambda: list(itertools.islice(rows, self.batch_size)), []):
+            self.write_batch(tab, headings, batch)
+            count += len(batch)
+        return count
+
+    def save(self):
+        """Closes all files"""
+        for writer, headings, types in self.files.values():
+            writer.close()
+        self.files = {}
+
+
+#Connection pools shared by all JiraComm objects {pool size:HTTPAdapter}
+ADAPTERS = {}
+ADAPTERS_LOCK = threading.Lock()
+
+def shared_adapter(pool_size=10):
+    """Returns HTTPAdapter (connection pool) to be mounted on Jira sessions.
+    The same adapter is returned for the same pool_size so that JiraComm objects
+    in the same process share open connections (keep-alive) rather than each
+    opening their own.
+    Args:
+        pool_size - maximum number of connections kept open for each server
+    """
+    with ADAPTERS_LOCK:
+        if pool_size not in ADAPTERS:
+            ADAPTERS[pool_size] = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        return ADAPTERS[pool_size]
+
+
+class PooledJIRA(JIRA):
+    """
+    JIRA client whose session is set up (connection pool mounted, response
+    hooks added) as soon as it is created, so the requests JIRA makes while
+    connecting (e.g. for the list of fields) already use the shared pool.
+
+    args:
+        as for JIRA, plus
+        adapter - HTTPAdapter mounted for http and https (see shared_adapter())
+        hooks - list of response hook functions added to session
+    """
+    def __init__(self, *args, **kwargs):
+        self.adapter = kwargs.pop("adapter")
+        self.hooks = kwargs.pop("hooks", [])
+        JIRA.__init__(self, *args, **kwargs)
+
+    def _create_http_basic_session(self, *args, **kwargs):
+        JIRA._create_http_basic_session(self, *args, **kwargs)
+        self._session.mount("https://", self.adapter)
+        self._session.mount("http://", self.adapter)
+        self._session.hooks["response"].extend(self.hooks)
+
+
 #Automatically executes if script is run directly but not if script imported as module
 if __name__=="__main__":
 
@@ -843,12 +3418,13 @@ if __name__=="__main__":
     # Dictionary holds mapping.
     # Keys are column titles from field mapping (above).
     # Values are keys from JiraComm.reprocess dictionary (definitions in JiraComm.define_reprocess_fns())
+    # (or column transforms from JiraComm.column_reprocess, see register_column_fn())
     # JiraComm.issue_details applies these automatically
     reprocess_mapping = {
-    "Sprint":"sprint name",
+    "Sprint":"sprint names",
     "Components":"name concat",
-    "Date Created":"date fix",
-    "Date Updated":"date fix",
+    "Date Created":"datetime",
+    "Date Updated":"datetime",
     "Latest Comment":"latest comment"
     }
 
@@ -867,10 +3443,8 @@ if __name__=="__main__":
     #If connection successful, do stuff
     if go.jira:
 
-        for pri, project in enumerate(["GB","K008","DEVTEST"]):
-            #Get all the bugs
-            go.get_project_issues(project=project)
-
+        def project_reports(project, pri):
+            """Writes the report tabs for a project (called by go.build_reports)"""
             #Write "All Bugs"
             tab = "All "+project+" Bugs"
             go.report(top_row=3, left_col=1, tab=tab, title=tab, column_widths=col_widths)
@@ -882,37 +3456,58 @@ if __name__=="__main__":
                 open_statuses = open_statuses_rc
 
             #Write "Open Bugs"
-            open_bugs = [result  for result in go.extracted_results if result["Status"] in open_statuses]
+            store = go.results_store()
+            open_positions = store.select("Status", open_statuses)
+            open_bugs = store.rows(open_positions)
             tab = "Open "+project+"Bugs"
-            go.report(top_row=3, left_col=1, tab=tab, title=tab, column_widths=col_widths)
+            go.report(results=open_bugs, top_row=3, left_col=1, tab=tab, title=tab, column_widths=col_widths)
 
             #Write Open bugs by application
             # (Aside - add column widths setting to go.report()?)
 
             #Open bugs by applications
-            #Find components aassociated with open bugs
-            components = [result["Components"]  for result in open_bugs]
-            components = list(set(components))#only want unique values
-            components.sort()
+            #Find components aassociated with open bugs (and the bugs for each)
+            by_component = store.group_by("Components", open_positions)
+            components = sorted(by_component)
             #
             tab = "Open "+project+" Bugs by Item"
             #Create sepearate table for each one
             row_offset = 0
             #Write results for each component
             for component in components:
-                bugs = [result  for result in open_bugs if result["Components"]==component]
+                bugs = store.rows(by_component[component])
                 go.report(results=bugs, top_row=3+row_offset, left_col=1, tab=tab, title=tab, column_widths=col_widths)
                 row_offset = row_offset + len(bugs) +3
 
             #Priority counts
+            write_priority_counts(project, pri, store.count_by("Priority", open_positions))
+
+        def write_priority_counts(project, pri, priority_counts):
+            """Writes table of counts of open bugs by priority to Info tab"""
             go.excel.cell_set(ws_id='Info',row=2,column=4+pri*3,value=project)
             go.excel.table_headings(tab="Info", row=3, column=4+pri*3,headings=["Priority", "Count"])
-            for pi, priority in enumerate(["P1 V. High", "P2 High", "P3 Medium", "P4 Low", "P5 V. Low"]):
-                things = [result for result in open_bugs if result["Priority"]==priority]
-                count = len(things)
+            for pi, priority in enumerate(priorities):
+                count = priority_counts.get(priority, 0)
                 go.excel.cell_set(ws_id='Info',row=4+pi,column=4+pri*3,border=True,value=priority)
                 go.excel.cell_set(ws_id='Info',row=4+pi,column=5+pri*3,border=True,value=count)
 
+        projects = ["GB","K008","DEVTEST"]
+        priorities = ["P1 V. High", "P2 High", "P3 Medium", "P4 Low", "P5 V. Low"]
+
+        #Only priority counts wanted - get them from Jira without retrieving issues
+        if "--counts" in sys.argv:
+            for pri, project in enumerate(projects):
+                open_statuses = open_statuses_devtest if project=="DEVTEST" else open_statuses_rc
+                write_priority_counts(project, pri, go.priority_counts(project, open_statuses, priorities))
+            go.excel.save()
+            sys.exit()
+
+        #Get all the bugs (one search for all projects) and write reports
+        go.build_reports(projects, project_reports, combined=True)
+
+        #Add timings and counts for run (when go created with stats=True)
+        go.write_run_stats()
+
         #Add some hyperlinks to Info tab
         go.excel.cell_set(ws_id="Info", row=1, column=1, value="Contents", bold=True)
         ws = go.excel.wb["Info"]
@@ -933,6 +3528,7 @@ if __name__=="__main__":
 
         #Save spreadsheet
         go.excel.save()
+        go.save_run_stats()
         print "Created: "+go.excel_filename
     else:
         print "*** Access Failed ***"
@@ -0,0 +1,367 @@
+"""
+Tests for jira_report(1.3-WIP).py, run against the stub Jira server from
+jira_benchmark.py. Run from the repository folder using:
+    python -m unittest discover tests
+"""
+import datetime
+import imp
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+jira_benchmark = imp.load_source("jira_benchmark", os.path.join(ROOT, "jira_benchmark.py"))
+jira_report = jira_benchmark.jira_report
+
+
+class StubTestCase(unittest.TestCase):
+    """Starts a stub Jira server with fake issues and a JiraComm using it"""
+    issue_count = 120
+    page_cap = 1000
+    latency = 0
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.server = jira_benchmark.StubJiraServer(jira_benchmark.make_fake_issues(self.issue_count),
+                                                    page_cap=self.page_cap, latency=self.latency)
+        self.go = self.jira_comm()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.folder)
+
+    def jira_comm(self, cls=None, **kwargs):
+        cls = cls or jira_report.JiraComm
+        return cls("test", "test", folder=self.folder, snapshot_folder=os.path.join(self.folder, "Snapshots"),
+                   server=self.server.url, **kwargs)
+
+    def searches(self):
+        return self.server.requests.get("/rest/api/2/search", 0)
+
+
+class IncrementalTest(StubTestCase):
+    def test_incremental_issue_objects(self):
+        first = self.go.retrieve_project_issues("K008", incremental=True)
+        self.assertEqual(len(first), self.issue_count)
+
+        #Change one issue after the snapshot was taken
+        changed = self.server.by_key["K008-7"]
+        changed["fields"]["updated"] = "2017-01-01T09:00:00.000+0000"
+        changed["fields"]["summary"] = "Changed since snapshot"
+
+        issues = self.go.retrieve_project_issues("K008", incremental=True)
+        self.assertEqual(len(issues), self.issue_count)
+        self.assertTrue(all(isinstance(issue, jira_report.Issue) for issue in issues))
+        by_key = dict((issue.key, issue) for issue in issues)
+        self.assertEqual(by_key["K008-7"].fields.summary, "Changed since snapshot")
+        self.assertEqual(len(set(issue.key for issue in issues)), self.issue_count)
+
+    def test_unreadable_snapshot_ignored(self):
+        self.go.retrieve_project_issues("K008", incremental=True, raw=True)
+        snapshot_file = self.go.snapshot_filename("K008")
+        #Run killed part way through saving
+        with open(snapshot_file) as f:
+            saved = f.read()
+        with open(snapshot_file, "w") as f:
+            f.write(saved[:len(saved)/2])
+
+        issues = self.go.retrieve_project_issues("K008", incremental=True, raw=True)
+        self.assertEqual(len(issues), self.issue_count)
+        self.assertEqual(os.listdir(os.path.dirname(snapshot_file)), ["K008_snapshot.json"])
+        with open(snapshot_file) as f:
+            self.assertEqual(len(json.load(f)["issues"]), self.issue_count)
+
+    def test_partial_changes_merged_but_not_saved(self):
+        self.go.retrieve_project_issues("K008", incremental=True, raw=True)
+        snapshot_file = self.go.snapshot_filename("K008")
+        with open(snapshot_file) as f:
+            saved = f.read()
+
+        for number in (3, 4, 5):
+            self.server.by_key["K008-%i" % number]["fields"]["updated"] = "2017-01-0%iT09:00:00.000+0000" % number
+        #Second page of changes fails
+        self.server.search_errors = [None, 400]
+        issues = self.go.retrieve_project_issues("K008", incremental=True, raw=True, max_results=2)
+        self.assertEqual(len(issues), self.issue_count)
+        self.assertFalse(self.go.complete["K008"])
+        #Only the changes on the first page merged
+        changed = [issue["key"] for issue in issues if issue["fields"]["updated"].startswith("2017")]
+        self.assertTrue(0 < len(changed) < 3)
+        with open(snapshot_file) as f:
+            self.assertEqual(f.read(), saved)
+
+        #Next run gets all the changes
+        issues = self.go.retrieve_project_issues("K008", incremental=True, raw=True, max_results=2)
+        self.assertTrue(self.go.complete["K008"])
+        changed = [issue["key"] for issue in issues if issue["fields"]["updated"].startswith("2017")]
+        self.assertEqual(sorted(changed), ["K008-3", "K008-4", "K008-5"])
+
+
+class BulkCommentsTest(StubTestCase):
+    issue_count = 250
+
+    def test_bulk_comments_match_issue_comments(self):
+        issues = self.go.retrieve_project_issues("K008", fields="summary")
+        searches = self.searches()
+
+        comments = self.go.bulk_issue_comments(issues, batch_size=100)
+        #One search per batch of 100 issues
+        self.assertEqual(self.searches() - searches, 3)
+        self.assertEqual(sorted(comments), sorted(issue.key for issue in issues))
+        for issue in issues[:20]:
+            self.assertEqual(comments[issue.key], self.go.issue_comments(issue))
+
+    def test_deleted_issue_does_not_lose_batch(self):
+        issues = self.go.retrieve_project_issues("K008", fields="summary")
+        self.server.issues.remove(self.server.by_key.pop("K008-50"))
+        comments = self.go.bulk_issue_comments(issues, batch_size=100)
+        self.assertEqual(len(comments), self.issue_count-1)
+        self.assertFalse("K008-50" in comments)
+        self.assertEqual(self.go.incomplete, set())
+
+
+class SearchKeysTest(StubTestCase):
+    issue_count = 250
+    page_cap = 40
+
+    def test_batches_paged_by_jira_page_size(self):
+        keys = ["K008-%i" % number for number in range(1, self.issue_count+1)]
+        pages = self.go.search_keys(keys, "summary", raw=True, batch_size=100)
+        self.assertEqual(sorted(issue["key"] for page in pages for issue in page), sorted(keys))
+        self.assertEqual(self.go.incomplete, set())
+
+
+class LazyFieldsTest(StubTestCase):
+    def test_missing_lazy_issues_mark_report_incomplete(self):
+        headings = ["ID", "Summary", "Description"]
+        self.go.get_project_issues("K008", headings=headings)
+        self.assertEqual(self.go.lazy_headings, set(["Description"]))
+
+        #Issue deleted from Jira before its description retrieved
+        self.server.issues.remove(self.server.by_key.pop("K008-5"))
+        self.go.report(tab="Lazy", headings=headings)
+        self.assertFalse(self.go.latest_complete)
+        self.assertTrue(self.go.report_title("Lazy", 1).endswith("INCOMPLETE"))
+        #Rest of the batch still filled in
+        for result in self.go.extracted_results:
+            if result["ID"] != "K008-5":
+                self.assertEqual(result["Description"], self.server.by_key[result["ID"]]["fields"]["description"])
+
+
+class RetryTest(StubTestCase):
+    def test_busy_search_retried(self):
+        self.server.search_errors = [429]
+        issues = self.go.retrieve_project_issues("K008")
+        self.assertEqual(len(issues), self.issue_count)
+        self.assertEqual(self.searches(), 2)
+        self.assertEqual(self.go.page_timings[-1]["attempts"], 2)
+        self.assertTrue(self.go.complete["K008"])
+
+    def test_failed_search_retried_up_to_max_retries(self):
+        self.go.max_retries = 1
+        self.server.search_errors = [429, 429]
+        issues = self.go.retrieve_project_issues("K008")
+        self.assertEqual(issues, [])
+        self.assertEqual(self.searches(), 2)
+        self.assertFalse(self.go.complete["K008"])
+
+
+class ParallelPagesTest(StubTestCase):
+    issue_count = 200
+
+    def test_parallel_pages_in_sequential_order(self):
+        sequential = [issue["key"] for issue in self.go.retrieve_project_issues("K008", max_results=25, raw=True)]
+
+        #Later pages take less time, so they finish before earlier ones
+        search_issues = self.go.jira.search_issues
+        def slow_search_issues(*args, **kwargs):
+            time.sleep(0.02 * (self.issue_count - kwargs.get("startAt", 0)) / 25)
+            return search_issues(*args, **kwargs)
+        self.go.jira.search_issues = slow_search_issues
+
+        parallel = [issue["key"] for issue in self.go.retrieve_project_issues("K008", max_results=25, raw=True,
+                                                                           workers=4)]
+        self.assertEqual(len(sequential), self.issue_count)
+        self.assertEqual(parallel, sequential)
+        #Pages really did finish out of order
+        timings = [timing["start_at"] for timing in self.go.page_timings[len(self.go.page_timings)-8:]]
+        self.assertNotEqual(timings, sorted(timings))
+
+
+class AsyncJiraCommTest(StubTestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        issues = jira_benchmark.make_fake_issues(60) + jira_benchmark.make_fake_issues(40, project="GB", seed=2)
+        self.server = jira_benchmark.StubJiraServer(issues, latency=0.01)
+        self.go = self.jira_comm(jira_report.AsyncJiraComm, pool_workers=4)
+
+    def tearDown(self):
+        self.go.close()
+        StubTestCase.tearDown(self)
+
+    def test_requests_run_together(self):
+        finished = []
+        runs = [self.go.get_project_issues_async(project, callback=finished.append, raw=True)
+                for project in ("K008", "GB")]
+        issue = self.go.get_issue_async("GB-3")
+        runs = self.go.gather(runs, timeout=30)
+
+        self.assertEqual([run["project"] for run in runs], ["K008", "GB"])
+        self.assertEqual([len(run["extracted_results"]) for run in runs], [60, 40])
+        self.assertEqual(len(finished), 2)
+        self.assertEqual(issue.get(30).key, "GB-3")
+        self.assertEqual(runs[1]["extracted_results"][0]["ID"], "GB-40")
+        #Latest run details left alone
+        self.assertEqual(self.go.extracted_results, [])
+
+        issues = self.go.retrieve_project_issues("GB", fields="summary")
+        comments = self.go.bulk_issue_comments_async(issues, batch_size=25).get(30)
+        self.assertEqual(comments, self.go.bulk_issue_comments(issues, refresh=True))
+
+
+class HighlightTest(StubTestCase):
+    def test_counts_ignore_case_like_excel(self):
+        self.go.get_project_issues("K008", raw=True)
+        self.go.report(tab="All")
+        statuses = [result["Status"] for result in self.go.extracted_results]
+        counts = self.go.highlight("All", [("Status", "equals", "failed"),
+                                           ("Status", "in", ["IN TEST", "Closed"]),
+                                           ("Summary", "contains", "REPORT")])
+        self.assertEqual(counts[0], statuses.count("Failed"))
+        self.assertEqual(counts[1], statuses.count("In Test") + statuses.count("Closed"))
+        self.assertEqual(counts[2], len([result for result in self.go.extracted_results
+                                         if "report" in result["Summary"].lower()]))
+
+
+class StreamReportTest(StubTestCase):
+    page_cap = 50
+
+    def test_stream_report_matches_report(self):
+        count = self.go.stream_report("K008", tab="Streamed", keep=True)
+        streamed = [dict(result.items()) for result in self.go.extracted_results]
+        self.assertEqual(count, self.issue_count)
+        self.assertEqual(self.searches(), 3)
+
+        self.go.get_project_issues("K008", raw=True)
+        self.assertEqual(streamed, [dict(result.items()) for result in self.go.extracted_results])
+
+
+class ConnectionPoolTest(StubTestCase):
+    def test_pool_used_while_connecting(self):
+        #JIRA asks for the list of fields while connecting
+        self.assertEqual(self.server.requests.get("/rest/api/2/field"), 1)
+        adapter = jira_report.shared_adapter(10)
+        self.assertTrue(self.go.jira._session.get_adapter(self.server.url) is adapter)
+        port = int(self.server.url.split(":")[-1])
+        hosts = [(key.key_host, key.key_port) for key in adapter.poolmanager.pools.keys()]
+        self.assertTrue(("127.0.0.1", port) in hosts)
+
+
+class ResultRowTest(unittest.TestCase):
+    def test_compares_with_mappings_only(self):
+        row_type = jira_report.result_row_type(["ID", "Status"])
+        row = row_type(["K008-1", "Failed"])
+        self.assertEqual(row, {"ID":"K008-1", "Status":"Failed"})
+        self.assertEqual(row, row_type(["K008-1", "Failed"]))
+        self.assertNotEqual(row, row_type(["K008-1", "Closed"]))
+        self.assertNotEqual(row, None)
+        self.assertNotEqual(row, ["K008-1", "Failed"])
+        self.assertFalse(row == "K008-1")
+        self.assertTrue(row in [None, "x", {"ID":"K008-1", "Status":"Failed"}])
+
+
+class CountTest(StubTestCase):
+    def test_priority_counts_without_retrieving_issues(self):
+        issues = self.server.issues
+        statuses = ["Failed", "In Test"]
+        priorities = ["P1 V. High", "P2 High"]
+        filters = list(warnings.filters)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            counts = self.go.priority_counts("K008", statuses, priorities)
+        for priority in priorities:
+            self.assertEqual(counts[priority], len([issue for issue in issues
+                                                    if issue["fields"]["priority"]["name"] == priority
+                                                    and issue["fields"]["status"]["name"] in statuses]))
+        self.assertEqual([str(warning.message) for warning in caught], [])
+        #Warning filter only changed while counting
+        self.assertEqual(warnings.filters, filters)
+
+
+class ReportTest(StubTestCase):
+    def test_report_of_selected_results(self):
+        self.go.get_project_issues("K008", raw=True)
+        store = self.go.results_store()
+        failed = store.rows(store.select("Status", ["Failed"]))
+        self.go.report(results=failed, tab="Failed")
+        self.go.report(results=[], tab="None")
+        rows = lambda tab: len([row for row in self.go.excel.wb[tab].iter_rows(min_row=3) if row[0].value])
+        self.assertEqual(rows("Failed"), len(failed))
+        self.assertEqual(rows("None"), 0)
+
+
+class KeysetPagingTest(StubTestCase):
+    issue_count = 130
+    page_cap = 20
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        #Issue moved into project: new key with high number but id lower than the rest
+        moved = self.server.by_key["K008-125"]
+        moved["id"] = "900"
+        other = jira_benchmark.make_fake_issues(30, project="GB", seed=2)[0]
+        self.server.issues.append(other)
+        self.server.by_key[other["key"]] = other
+        self.server.projects["GB"] = "GB (stub)"
+        self.keys = ["K008-%i" % number for number in range(1, self.issue_count+1)]
+
+    def test_keyset_pages_in_key_order(self):
+        issues = self.go.retrieve_project_issues("K008", raw=True, paging="keyset", max_results=50)
+        self.assertEqual([issue["key"] for issue in issues], self.keys)
+        self.assertTrue(self.go.complete["K008"])
+
+    def test_parallel_ranges_in_key_order(self):
+        issues = self.go.retrieve_project_issues("K008", raw=True, paging="keyset", workers=3)
+        self.assertEqual([issue["key"] for issue in issues], self.keys)
+        self.assertTrue(self.go.complete["K008"])
+
+    def test_several_projects_use_offset_paging(self):
+        issues = self.go.retrieve_project_issues(["K008", "GB"], raw=True, paging="keyset", workers=3)
+        self.assertEqual(sorted(issue["key"] for issue in issues), sorted(self.keys + ["GB-30"]))
+        self.assertTrue(self.go.complete["GB"])
+
+
+class WriteOnlyTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def saved_values(self, write_only):
+        filename = os.path.join(self.folder, "%s.xlsx" % write_only)
+        excel = jira_report.ExcelSheet(filename, tabrename="Rows", write_only=write_only)
+        excel.cell_set("Rows", 1, 1, "Title", bold=True)
+        #Note beside the table, set before its rows written
+        excel.cell_set("Rows", 4, 5, "Note")
+        excel.table_rows("Rows", 3, 2, [["A", 1, datetime.datetime(2016, 3, 1, 9, 30)],
+                                        ["B", 2, None], ["C", 3, "x"]], border=True)
+        excel.cell_set("Rows", 7, 1, "After")
+        excel.save()
+        ws = jira_report.openpyxl.load_workbook(filename)["Rows"]
+        return [[(cell.value, cell.number_format, cell.border.left.style) for cell in row]
+                for row in ws.iter_rows(min_row=1, max_row=7, max_col=5)]
+
+    def test_write_only_rows_match_normal(self):
+        rows = self.saved_values(True)
+        self.assertEqual(rows, self.saved_values(False))
+        self.assertEqual(rows[3][4][0], "Note")
+        self.assertEqual(rows[2][3][1], "dd/mm/yyyy hh:mm:ss")
+
+
+if __name__ == "__main__":
+    unittest.main()